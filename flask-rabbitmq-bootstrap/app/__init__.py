@@ -1,5 +1,13 @@
+import os
+
 from flask import Flask
 
+from app.instrumentation import Instrumentation
+
 app = Flask(__name__)
+app.config['METRICS_PROFILE_ENDPOINTS'] = []  # e.g. ['bulk'] to sample its stacks
+# /metrics needs 'Authorization: Bearer <token>'; without a token it is closed
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+instrumentation = Instrumentation(app)
 
 from app import routes
\ No newline at end of file
@@ -0,0 +1,194 @@
+import queue
+import threading
+
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+
+from app.instrumentation import PUBLISH_LATENCY
+
+
+class _PooledChannel:
+    """One broker connection with its publish channels.
+
+    pika's BlockingConnection is not thread-safe, so a pooled entry is only
+    ever used by the thread that checked it out.
+    """
+
+    def __init__(self, parameters):
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+        self._batch_channel = None
+        self.reused = False  # set once it has been returned to the pool
+
+    @property
+    def batch_channel(self):
+        # Confirm mode and transactions can't share a channel, so bulk
+        # publishes get their own transactional channel.
+        if self._batch_channel is None:
+            self._batch_channel = self.connection.channel()
+            self._batch_channel.tx_select()
+        return self._batch_channel
+
+    @property
+    def is_open(self):
+        return self.connection.is_open and self.channel.is_open
+
+    def is_alive(self):
+        """is_open only changes on I/O, so do some: a dead socket raises here."""
+        if not self.is_open:
+            return False
+        try:
+            # Also answers the heartbeats that went unserviced while idle
+            self.connection.process_data_events(0)
+        except (AMQPConnectionError, AMQPChannelError, OSError):
+            return False
+        return self.is_open
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except AMQPConnectionError:
+            pass
+
+
+class Publisher:
+    """Process-wide RabbitMQ publisher backed by a pool of warm connections."""
+
+    def __init__(self, host='rabbitmq', queue_name='task_queue', pool_size=4,
+                 batch_size=100, acquire_timeout=5):
+        self.parameters = pika.ConnectionParameters(host, heartbeat=60)
+        self.queue_name = queue_name
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.acquire_timeout = acquire_timeout
+        self.properties = pika.BasicProperties(delivery_mode=2)  # make message persistent
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._declared = False
+
+    def _open(self):
+        entry = _PooledChannel(self.parameters)
+        with self._lock:
+            declare = not self._declared
+            self._declared = True
+        if declare:
+            try:
+                entry.channel.queue_declare(queue=self.queue_name, durable=True)
+            except Exception:
+                with self._lock:
+                    self._declared = False
+                raise
+        return entry
+
+    def _acquire(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.pool_size
+                    if can_create:
+                        self._created += 1
+                if not can_create:
+                    entry = self._idle.get(timeout=self.acquire_timeout)
+                else:
+                    try:
+                        return self._open()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+            if entry.is_alive():
+                return entry
+            # Broker dropped this connection while it was idle.
+            self._discard(entry)
+
+    def _release(self, entry):
+        entry.reused = True
+        self._idle.put(entry)
+
+    def _discard(self, entry):
+        entry.close()
+        with self._lock:
+            self._created -= 1
+
+    def _run(self, operation):
+        # Pooled connections may have gone away since their last use; give up
+        # only when a connection opened for this call fails too.
+        while True:
+            entry = self._acquire()
+            try:
+                result = operation(entry)
+            except (AMQPConnectionError, AMQPChannelError):
+                self._discard(entry)
+                if not entry.reused:
+                    raise
+                continue
+            except Exception:
+                self._release(entry)
+                raise
+            self._release(entry)
+            return result
+
+    def publish(self, message):
+        def operation(entry):
+            entry.channel.basic_publish(
+                exchange='',
+                routing_key=self.queue_name,
+                body=message,
+                properties=self.properties,
+                mandatory=True)
+        with PUBLISH_LATENCY.time(self.queue_name, 'message'):
+            self._run(operation)
+
+    def publish_many(self, messages):
+        """Publish messages in batches; each batch costs one broker round-trip.
+
+        A batch is committed with tx.commit, which the broker only answers
+        once every message in it has been accepted, so a returned call means
+        all messages were confirmed. Returns the number of messages sent.
+        """
+        messages = list(messages)
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+
+            def operation(entry):
+                channel = entry.batch_channel
+                for message in batch:
+                    channel.basic_publish(
+                        exchange='',
+                        routing_key=self.queue_name,
+                        body=message,
+                        properties=self.properties)
+                channel.tx_commit()
+            with PUBLISH_LATENCY.time(self.queue_name, 'batch'):
+                self._run(operation)
+        return len(messages)
+
+    def warm(self):
+        """Open a pooled connection now instead of on the first publish."""
+        self._release(self._acquire())
+
+    def after_fork(self):
+        """Forget connections inherited from the parent process.
+
+        A forked child shares the parent's sockets, so it must neither use
+        nor close them; it opens its own as it needs them.
+        """
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def close(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
+
+
+publisher = Publisher()
@@ -1,6 +1,6 @@
-from flask import render_template, request, redirect, url_for
-import pika
+from flask import render_template, request, redirect, url_for, jsonify
 from app import app
+from app.publisher import publisher
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -10,15 +10,17 @@ def index():
         return redirect(url_for('index'))
     return render_template('index.html')
 
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    data = request.get_json(silent=True)
+    messages = data.get('messages', []) if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return jsonify({'error': 'expected {"messages": [<string>, ...]}'}), 400
+    published = send_messages_to_queue(messages)
+    return jsonify({'published': published})
+
 def send_message_to_queue(message):
-    connection = pika.BlockingConnection(pika.ConnectionParameters('rabbitmq'))
-    channel = connection.channel()
-    channel.queue_declare(queue='task_queue', durable=True)
-    channel.basic_publish(
-        exchange='',
-        routing_key='task_queue',
-        body=message,
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # make message persistent
-        ))
-    connection.close()
\ No newline at end of file
+    publisher.publish(message)
+
+def send_messages_to_queue(messages):
+    return publisher.publish_many(messages)
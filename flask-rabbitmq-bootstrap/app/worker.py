@@ -1,18 +1,131 @@
-import pika
+import argparse
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
 
-def callback(ch, method, properties, body):
+logger = logging.getLogger('worker')
+
+
+def callback(body):
     print(f" [x] Received {body.decode()}")
     time.sleep(body.count(b'.'))
     print(" [x] Done")
-    ch.basic_ack(delivery_tag=method.delivery_tag)
 
-connection = pika.BlockingConnection(pika.ConnectionParameters('rabbitmq'))
-channel = connection.channel()
 
-channel.queue_declare(queue='task_queue', durable=True)
-channel.basic_qos(prefetch_count=1)
-channel.basic_consume(queue='task_queue', on_message_callback=callback)
+class Worker:
+    """One consumer connection with its own prefetch window.
+
+    Deliveries are handed to a thread pool so up to `concurrency` messages
+    run at once. pika connections are not thread-safe, so pool threads never
+    touch the channel: acks are scheduled back onto the connection thread
+    with add_callback_threadsafe.
+    """
+
+    def __init__(self, name, stopping, host='rabbitmq', queue_name='task_queue',
+                 prefetch=1, concurrency=None):
+        self.name = name
+        self.stopping = stopping
+        self.host = host
+        self.queue_name = queue_name
+        self.prefetch = prefetch
+        self.concurrency = concurrency or prefetch
+
+    def run(self):
+        connection = pika.BlockingConnection(pika.ConnectionParameters(self.host))
+        channel = connection.channel()
+        channel.queue_declare(queue=self.queue_name, durable=True)
+        channel.basic_qos(prefetch_count=self.prefetch)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                      thread_name_prefix=self.name)
+
+        def on_message(ch, method, properties, body):
+            executor.submit(self._handle, connection, ch, method.delivery_tag, body)
+
+        consumer_tag = channel.basic_consume(queue=self.queue_name,
+                                             on_message_callback=on_message)
+        logger.info('%s consuming (prefetch=%d, concurrency=%d)',
+                    self.name, self.prefetch, self.concurrency)
+        while not self.stopping.is_set():
+            connection.process_data_events(time_limit=1)
+
+        # Stop new deliveries, let in-flight messages finish, then flush their acks.
+        channel.basic_cancel(consumer_tag)
+        executor.shutdown(wait=True)
+        connection.process_data_events(time_limit=0)
+        connection.close()
+        logger.info('%s stopped', self.name)
+
+    def _handle(self, connection, channel, delivery_tag, body):
+        started = time.perf_counter()
+        try:
+            callback(body)
+        except Exception:
+            logger.exception('%s failed on message %r', self.name, body)
+            ack = functools.partial(channel.basic_nack, delivery_tag=delivery_tag, requeue=False)
+        else:
+            ack = functools.partial(channel.basic_ack, delivery_tag=delivery_tag)
+        logger.info('%s processed %r in %.3fs', self.name, body, time.perf_counter() - started)
+        connection.add_callback_threadsafe(ack)
+
+
+def run_worker(name, stopping, options):
+    # Children leave signal handling to the parent, which sets `stopping`.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    Worker(name, stopping, options.host, options.queue, options.prefetch,
+           options.concurrency).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consume task_queue with a pool of workers.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of consumer connections (default: CPU count)')
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread',
+                        help='run workers as threads or as separate processes')
+    parser.add_argument('--prefetch', type=int, default=10,
+                        help='unacked messages each worker may hold')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='messages each worker processes at once (default: prefetch)')
+    parser.add_argument('--host', default='rabbitmq')
+    parser.add_argument('--queue', default='task_queue')
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(processName)s %(message)s')
+
+    if options.mode == 'process':
+        stopping = multiprocessing.Event()
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=(f'worker-{i}', stopping, options),
+                                           name=f'worker-{i}')
+                   for i in range(options.workers)]
+    else:
+        stopping = threading.Event()
+        workers = [threading.Thread(target=Worker(f'worker-{i}', stopping, options.host,
+                                                  options.queue, options.prefetch,
+                                                  options.concurrency).run)
+                   for i in range(options.workers)]
+
+    def shutdown(signum, frame):
+        logger.info('Shutting down, waiting for in-flight messages')
+        stopping.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for worker in workers:
+        worker.start()
+    print(' [*] Waiting for messages. To exit press CTRL+C')
+    for worker in workers:
+        worker.join()
+
 
-print(' [*] Waiting for messages. To exit press CTRL+C')
-channel.start_consuming()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
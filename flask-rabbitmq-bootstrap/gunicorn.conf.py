@@ -0,0 +1,67 @@
+"""gunicorn settings for the production entry point (wsgi.py).
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported and warmed up once in the master (preload_app), so
+workers are forked with compiled templates and primed caches already in
+memory. Each worker then calls wsgi.after_fork() to drop the database and
+broker connections it inherited and open its own.
+
+Workers and threads follow the CPUs this container may use (its cgroup
+quota, not the host's core count). WEB_CONCURRENCY, GUNICORN_THREADS and
+BIND override them.
+"""
+import math
+import os
+
+
+def available_cpus():
+    """CPUs this process may use: the cgroup quota if there is one, else its affinity mask."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" when unlimited
+        with open('/sys/fs/cgroup/cpu.max') as cpu_max:
+            limit, period = cpu_max.read().split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means unlimited
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as limit_file, \
+                    open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as period_file:
+                limit, period = int(limit_file.read()), int(period_file.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+cpus = available_cpus()
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 0)) or cpus * 2 + 1
+# Threads let a worker overlap requests waiting on SQLite or the broker. An
+# open notification stream (/notifications/stream) holds one for its lifetime.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 0)) or 8
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+if os.path.isdir('/dev/shm'):
+    # Worker heartbeat files; a container's overlay filesystem can stall them
+    worker_tmp_dir = '/dev/shm'
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.after_fork()
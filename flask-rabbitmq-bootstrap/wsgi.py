@@ -0,0 +1,51 @@
+"""Production entry point for the app package.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+create_app() compiles the templates and sends one request through the app
+before serving. gunicorn.conf.py preloads this module in the master, so
+workers are forked with that work already done. after_fork() gives each
+worker its own RabbitMQ connections and opens the first one before the
+worker accepts requests.
+"""
+import logging
+
+from pika.exceptions import AMQPError
+
+from app import app as flask_app
+from app.instrumentation import HISTOGRAMS
+from app.publisher import publisher
+
+logger = logging.getLogger(__name__)
+
+
+def warmup(app):
+    """Do the work of a worker's first requests now, in the master."""
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+    # One request through the whole stack; GET doesn't touch the broker
+    response = app.test_client().get('/')
+    if response.status_code != 200:
+        logger.warning('Warmup request to / returned %s', response.status_code)
+
+
+def after_fork():
+    """Called in each gunicorn worker right after it is forked from the master."""
+    publisher.after_fork()
+    # Metrics are per worker; don't report the master's warmup as traffic
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+    try:
+        publisher.warm()
+    except (AMQPError, OSError):
+        # The broker may still be starting; the first publish connects instead
+        logger.warning('Could not connect to RabbitMQ at %s yet', publisher.parameters.host)
+
+
+def create_app():
+    warmup(flask_app)
+    return flask_app
+
+
+app = create_app()
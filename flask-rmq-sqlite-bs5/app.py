@@ -1,17 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for
-from models import db, Task
-import pika
+from flask import Flask, render_template, request, redirect, url_for, jsonify
+from models import db, Task, Outbox
+from relay import OutboxRelay
+from sqlite_profile import configure_sqlite, install_profile_pragmas
+from instrumentation import Instrumentation
+import atexit
+import os
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tasks.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PROFILE'] = 'performance'  # default, durable, performance
+# Each process's relay drains the outbox only while it holds the lease, so one
+# publishes at a time. OUTBOX_RELAY_IN_PROCESS=false leaves it to `python relay.py`.
+app.config['OUTBOX_RELAY_IN_PROCESS'] = os.environ.get('OUTBOX_RELAY_IN_PROCESS', 'true').lower() == 'true'
+app.config['METRICS_PROFILE_ENDPOINTS'] = []  # e.g. ['complete_task'] to sample its stacks
+# /metrics needs 'Authorization: Bearer <token>'; without a token it is closed
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
+configure_sqlite(app)
 db.init_app(app)
+install_profile_pragmas(app, db)
+# Route, SQL and RabbitMQ publish latency on /metrics
+instrumentation = Instrumentation(app)
 
-# RabbitMQ connection
-connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-channel = connection.channel()
-channel.queue_declare(queue='task_updates')
+relay = OutboxRelay(app)
+if app.config['OUTBOX_RELAY_IN_PROCESS']:
+    # Started now rather than on the first completed task, so rows left from
+    # before a restart are published right away
+    relay.start()
+atexit.register(relay.close)
 
 @app.route('/')
 def home():
@@ -39,15 +56,19 @@ def admin():
 def complete_task(task_id):
     task = Task.query.get(task_id)
     task.status = 'Completed'
+    # Event is committed together with the status change; the relay publishes it
+    db.session.add(Outbox(routing_key='task_updates', body=f'Task {task_id} completed'))
     db.session.commit()
     
-    # Send message to RabbitMQ
-    channel.basic_publish(exchange='',
-                          routing_key='task_updates',
-                          body=f'Task {task_id} completed')
+    if app.config['OUTBOX_RELAY_IN_PROCESS']:
+        relay.wake()
     
     return redirect(url_for('admin'))
 
+@app.route('/outbox/stats')
+def outbox_stats():
+    return jsonify(pending=Outbox.query.count(), **relay.stats())
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
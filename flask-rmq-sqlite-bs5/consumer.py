@@ -1,15 +1,119 @@
-import pika
-
-def callback(ch, method, properties, body):
-    print(f"Received {body}")
-
-connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
-channel = connection.channel()
-channel.queue_declare(queue='task_updates')
-
-channel.basic_consume(queue='task_updates',
-                      on_message_callback=callback,
-                      auto_ack=True)
-
-print('Waiting for messages. To exit press CTRL+C')
-channel.start_consuming()
\ No newline at end of file
+import re
+import time
+from datetime import datetime
+
+import pika
+
+from app import app
+from models import db, Task, TaskEvent
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds a partial batch may wait before it is written
+# Messages that still fail on their own after one redelivery are parked here
+DEAD_LETTER_QUEUE = 'task_updates.dead'
+
+EVENT_PATTERN = re.compile(r'^Task (\d+) (\w+)$')
+STATUS_FOR_EVENT = {'completed': 'Completed'}
+
+
+def parse(body):
+    match = EVENT_PATTERN.match(body.decode())
+    if not match:
+        return None, 'unknown'
+    return int(match.group(1)), match.group(2).lower()
+
+
+def apply_batch(bodies):
+    """Write a whole batch of events in one transaction."""
+    received_at = datetime.utcnow()
+    events = []
+    status_updates = {}
+    for body in bodies:
+        task_id, event = parse(body)
+        events.append({'task_id': task_id, 'event': event, 'body': body.decode(),
+                       'received_at': received_at})
+        if task_id is not None and event in STATUS_FOR_EVENT:
+            status_updates.setdefault(STATUS_FOR_EVENT[event], set()).add(task_id)
+
+    with app.app_context():
+        try:
+            db.session.execute(TaskEvent.__table__.insert(), events)
+            for status, task_ids in status_updates.items():
+                Task.query.filter(Task.id.in_(task_ids)).update(
+                    {'status': status}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def dead_letter(channel, body, error):
+    # Published before the ack, so a crash in between leaves a copy in both queues, never neither
+    channel.basic_publish(exchange='', routing_key=DEAD_LETTER_QUEUE, body=body,
+                          properties=pika.BasicProperties(delivery_mode=2,
+                                                          headers={'x-error': str(error)[:500]}))
+
+
+def flush_one(channel, delivery_tag, redelivered, body):
+    try:
+        apply_batch([body])
+    except Exception as e:
+        if redelivered:
+            print(f'Message failed again, moving it to {DEAD_LETTER_QUEUE}: {e}')
+            dead_letter(channel, body, e)
+            channel.basic_ack(delivery_tag=delivery_tag)
+        else:
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+    else:
+        channel.basic_ack(delivery_tag=delivery_tag)
+
+
+def flush(channel, batch):
+    last_tag = batch[-1][0]
+    try:
+        apply_batch([body for _, _, body in batch])
+    except Exception as e:
+        # One bad message must not hold back the rest: write them one by one
+        print(f'Failed to write {len(batch)} messages, retrying one at a time: {e}')
+        for message in batch:
+            flush_one(channel, *message)
+    else:
+        channel.basic_ack(delivery_tag=last_tag, multiple=True)
+        print(f'Stored {len(batch)} messages')
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters('localhost'))
+    channel = connection.channel()
+    channel.queue_declare(queue='task_updates')
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+    # The broker must be allowed to hand us a full batch before the first ack.
+    channel.basic_qos(prefetch_count=BATCH_SIZE)
+
+    print('Waiting for messages. To exit press CTRL+C')
+    batch = []
+    first_received = None
+    try:
+        for method, properties, body in channel.consume('task_updates',
+                                                        inactivity_timeout=FLUSH_INTERVAL):
+            if method is not None:
+                if not batch:
+                    first_received = time.monotonic()
+                batch.append((method.delivery_tag, method.redelivered, body))
+            if batch and (len(batch) >= BATCH_SIZE
+                          or time.monotonic() - first_received >= FLUSH_INTERVAL):
+                flush(channel, batch)
+                batch = []
+    except KeyboardInterrupt:
+        if batch:
+            flush(channel, batch)
+    finally:
+        channel.cancel()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert
+from datetime import datetime
+import time
 
 db = SQLAlchemy()
 
@@ -10,4 +13,54 @@ class Task(db.Model):
     customer_id = db.Column(db.Integer, nullable=False)
 
     def __repr__(self):
-        return f'<Task {self.title}>'
\ No newline at end of file
+        return f'<Task {self.title}>'
+
+class Outbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    routing_key = db.Column(db.String(100), nullable=False, default='task_updates')
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Outbox {self.id} {self.routing_key}>'
+
+
+class OutboxLease(db.Model):
+    """Which relay may drain the outbox, and until when.
+
+    Every web process runs a relay, so without the lease each of them
+    would publish the same rows. A relay drains only while it holds the
+    lease and renews it on every pass; a lease that is not renewed (the
+    process died) expires and another relay takes over.
+    """
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)  # time.time()
+
+    @classmethod
+    def claim(cls, owner, seconds, name='outbox'):
+        """Statement that takes or renews the lease; its rowcount is 1 if `owner` holds it."""
+        now = time.time()
+        statement = insert(cls).values(name=name, owner=owner, expires_at=now + seconds)
+        return statement.on_conflict_do_update(
+            index_elements=[cls.name],
+            set_={'owner': statement.excluded.owner, 'expires_at': statement.excluded.expires_at},
+            where=(cls.owner == statement.excluded.owner) | (cls.expires_at < now))
+
+    @classmethod
+    def release(cls, owner, name='outbox'):
+        return cls.__table__.delete().where(cls.name == name, cls.owner == owner)
+
+    def __repr__(self):
+        return f'<OutboxLease {self.name} {self.owner}>'
+
+
+class TaskEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), index=True)
+    event = db.Column(db.String(50), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TaskEvent {self.task_id} {self.event}>'
@@ -0,0 +1,70 @@
+import logging
+import time
+
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerConnection:
+    """A pika connection that re-opens itself with exponential backoff.
+
+    Not thread-safe: each instance belongs to the single thread using it.
+    """
+
+    def __init__(self, host='localhost', queue_name='task_updates', transactional=False,
+                 min_backoff=0.5, max_backoff=30):
+        self.parameters = pika.ConnectionParameters(host, heartbeat=60)
+        self.queue_name = queue_name
+        self.transactional = transactional
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connection = None
+        self.channel = None
+
+    def connect(self):
+        self.connection = pika.BlockingConnection(self.parameters)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=self.queue_name)
+        if self.transactional:
+            self.channel.tx_select()
+
+    def disconnect(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except AMQPConnectionError:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def ensure_connected(self):
+        backoff = self.min_backoff
+        while self.connection is None or not self.connection.is_open:
+            try:
+                self.connect()
+            except AMQPConnectionError as e:
+                logger.warning('RabbitMQ connect failed (%s), retrying in %.1fs', e, backoff)
+                self.disconnect()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def heartbeat(self):
+        # Keep heartbeats flowing while idle.
+        if self.connection is not None:
+            try:
+                self.connection.process_data_events(0)
+            except (AMQPConnectionError, AMQPChannelError):
+                self.disconnect()
+
+    def run(self, operation):
+        """Call operation(channel), reconnecting and retrying until it succeeds."""
+        while True:
+            self.ensure_connected()
+            try:
+                return operation(self.channel)
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                logger.warning('RabbitMQ publish failed (%s), reconnecting', e)
+                self.disconnect()
+
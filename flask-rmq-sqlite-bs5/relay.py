@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+from instrumentation import PUBLISH_LATENCY
+from models import db, Outbox, OutboxLease
+from publisher import BrokerConnection
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Drains the Outbox table to RabbitMQ in batches.
+
+    Rows are written in the same transaction as the change they describe,
+    so an event is never lost if the broker is down. Each batch is published
+    inside one AMQP transaction and only deleted once tx.commit returns, so
+    delivery is at-least-once.
+
+    Only the relay holding the OutboxLease drains, so one relay per web
+    process doesn't publish every row once per process. A lease left by a
+    process that died expires after `lease_seconds`.
+    """
+
+    def __init__(self, app, host='localhost', batch_size=500, poll_interval=1.0,
+                 lease_seconds=30):
+        self.app = app
+        self.broker = BrokerConnection(host, transactional=True)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex}'
+        self.drained = 0
+        self.busy_seconds = 0.0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def rows_per_second(self):
+        return self.drained / self.busy_seconds if self.busy_seconds else 0.0
+
+    def stats(self):
+        return {
+            'drained': self.drained,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='outbox-relay',
+                                                daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Ask the relay to drain now instead of at the next poll."""
+        self.start()
+        self._wake.set()
+
+    def close(self, timeout=5):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def hold_lease(self):
+        """Take or renew the lease. True while this relay may drain."""
+        held = db.session.execute(OutboxLease.claim(self.owner, self.lease_seconds)).rowcount == 1
+        db.session.commit()
+        return held
+
+    def release_lease(self):
+        with self.app.app_context():
+            db.session.execute(OutboxLease.release(self.owner))
+            db.session.commit()
+
+    def drain_once(self):
+        """Publish and delete one batch of outbox rows. Returns the batch size."""
+        with self.app.app_context():
+            if not self.hold_lease():
+                return 0
+            rows = Outbox.query.order_by(Outbox.id).limit(self.batch_size).all()
+            if not rows:
+                return 0
+            started = time.perf_counter()
+
+            def operation(channel):
+                with PUBLISH_LATENCY.time(self.broker.queue_name, 'batch'):
+                    for row in rows:
+                        channel.basic_publish(exchange='', routing_key=row.routing_key, body=row.body)
+                    channel.tx_commit()
+            self.broker.run(operation)
+
+            Outbox.query.filter(Outbox.id.in_([row.id for row in rows])).delete(
+                synchronize_session=False)
+            db.session.commit()
+            self.drained += len(rows)
+            self.busy_seconds += time.perf_counter() - started
+            return len(rows)
+
+    def _run(self):
+        with self.app.app_context():
+            OutboxLease.__table__.create(db.engine, checkfirst=True)
+        while not self._stopping.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception:
+                logger.exception('Outbox relay failed to drain a batch')
+                drained = 0
+            if drained < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                if drained == 0:
+                    self.broker.heartbeat()
+        self.broker.disconnect()
+        try:
+            self.release_lease()
+        except Exception:
+            logger.exception('Outbox relay failed to release its lease')
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('OUTBOX_RELAY_IN_PROCESS', 'false')
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    relay = OutboxRelay(app)
+    with app.app_context():
+        OutboxLease.__table__.create(db.engine, checkfirst=True)
+    print('Draining outbox. To exit press CTRL+C')
+    logged = 0
+    try:
+        while True:
+            if relay.drain_once() < relay.batch_size:
+                if relay.drained != logged:
+                    logger.info('drained %(drained)d rows at %(rows_per_second).1f rows/sec',
+                                relay.stats())
+                    logged = relay.drained
+                time.sleep(relay.poll_interval)
+    except KeyboardInterrupt:
+        relay.broker.disconnect()
+        relay.release_lease()
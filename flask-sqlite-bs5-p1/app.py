@@ -1,10 +1,30 @@
+import os
+
 from flask import Flask, render_template, request, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
+from sqlite_profile import configure_sqlite, install_profile_pragmas
+from problem_index import ProblemIndex
+from assignment import AssignmentEngine
+from query_budget import QueryBudget
+from instrumentation import Instrumentation
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SECRET_KEY'] = 'your-secret-key'
+app.config['SQLITE_PROFILE'] = 'performance'  # default, durable, performance
+app.config['AUTO_RESOLVE_MIN_SCORE'] = 0.8  # 1.0 = একই শব্দগুলো থাকতে হবে
+app.config['METRICS_PROFILE_ENDPOINTS'] = []  # যেমন ['dashboard']; এই রাউটগুলোর স্ট্যাক স্যাম্পল হয়
+# /metrics-এ 'Authorization: Bearer <token>' লাগে; টোকেন না থাকলে বন্ধ
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# FLASK_ দিয়ে শুরু এনভায়রনমেন্ট ভেরিয়েবল কনফিগ বদলায়, যেমন FLASK_SQLALCHEMY_DATABASE_URI
+app.config.from_prefixed_env()
+configure_sqlite(app)
 db = SQLAlchemy(app)
+install_profile_pragmas(app, db)
+query_budget = QueryBudget(app)
+# রাউট, SQL-এর লেটেন্সি /metrics-এ
+instrumentation = Instrumentation(app)
 
 # ডেটাবেস মডেল
 class Customer(db.Model):
@@ -38,9 +58,29 @@ class Ticket(db.Model):
     status = db.Column(db.String(20), default='Open')
     solution = db.Column(db.String(500))
     assigned_engineer = db.Column(db.Integer, db.ForeignKey('engineer.id'))
+    engineer = db.relationship('Engineer')
+
+# সমস্যা নলেজবেসের ইন-মেমরি ইনডেক্স; পুরনো হলে ব্যাকগ্রাউন্ড থ্রেডে নতুন করে তৈরি হয়,
+# তাই লোডারের নিজের অ্যাপ কনটেক্সট লাগে
+def load_problems():
+    with app.app_context():
+        return db.session.query(Problem.id, Problem.service_type, Problem.description,
+                                Problem.solution).all()
+
+problem_index = ProblemIndex(load_problems)
+problem_index.track(Problem)
+
+def find_auto_solution(service_type, problem):
+    candidates = problem_index.search(service_type, problem, limit=1,
+                                      min_score=app.config['AUTO_RESOLVE_MIN_SCORE'])
+    return candidates[0] if candidates else None
+
+# সবচেয়ে কম লোডের ইঞ্জিনিয়ার বাছাই
+assignment = AssignmentEngine(db, Engineer, Ticket)
 
 # রাউটস
 @app.route('/')
+@query_budget.limit(1)
 def dashboard():
     tickets = Ticket.query.all()
     return render_template('dashboard.html', tickets=tickets)
@@ -53,7 +93,7 @@ def create_ticket():
         customer_id = request.form['customer_id']
         
         # স্বয়ংক্রিয় সমাধান চেক করুন
-        auto_solution = Problem.query.filter_by(service_type=service_type, description=problem).first()
+        auto_solution = find_auto_solution(service_type, problem)
         
         new_ticket = Ticket(
             service_type=service_type,
@@ -65,9 +105,7 @@ def create_ticket():
         
         if not auto_solution:
             # ইঞ্জিনিয়ার অ্যাসাইন করুন
-            suitable_engineer = Engineer.query.filter_by(expertise=service_type).first()
-            if suitable_engineer:
-                new_ticket.assigned_engineer = suitable_engineer.id
+            new_ticket.assigned_engineer = assignment.assign(service_type, db.session)
         
         db.session.add(new_ticket)
         db.session.commit()
@@ -76,10 +114,11 @@ def create_ticket():
     return render_template('create_ticket.html')
 
 @app.route('/ticket/<int:ticket_id>')
+@query_budget.limit(1)
 def view_ticket(ticket_id):
-    ticket = Ticket.query.get(ticket_id)
-    engineer = Engineer.query.get(ticket.assigned_engineer) if ticket.assigned_engineer else None
-    return render_template('ticket.html', ticket=ticket, engineer=engineer)
+    # ইঞ্জিনিয়ার একই কোয়েরিতে JOIN করে আনা হয়
+    ticket = db.get_or_404(Ticket, ticket_id, options=[joinedload(Ticket.engineer)])
+    return render_template('ticket.html', ticket=ticket, engineer=ticket.engineer)
 
 if __name__ == '__main__':
     with app.app_context():
@@ -93,4 +132,5 @@ if __name__ == '__main__':
             ]
             db.session.bulk_save_objects(engineers)
             db.session.commit()
+        assignment.rebuild()
         app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import heapq
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+# এই স্ট্যাটাসের টিকেট ইঞ্জিনিয়ারের লোডে গোনা হয় না
+CLOSED_STATUSES = {'Auto-Resolved', 'Resolved', 'Confirmed', 'Closed'}
+
+
+class AssignmentEngine:
+    """Assigns tickets to the least-loaded engineer with matching expertise.
+
+    Keeps a min-heap of (open tickets, engineer id) per expertise. Loads
+    change only when a ticket change commits; stale heap entries are
+    skipped lazily, so picking and updating are both O(log n). An
+    assignment is reserved until its transaction ends, so concurrent
+    requests don't all pick the same engineer.
+
+    Commits only update the loads of the process that made them, so once
+    the loads are `max_age` seconds old the next assign() re-reads them
+    from the database, which counts other processes' assignments too.
+    Reservations still open are added on top of the new counts.
+    """
+
+    def __init__(self, db, engineer_model, ticket_model, max_age=30):
+        self.db = db
+        self.Engineer = engineer_model
+        self.Ticket = ticket_model
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # one rebuild at a time
+        self._heaps = {}
+        self._loads = {}
+        self._reserved = Counter()  # engineer id -> reservations not yet committed
+        self._expertise = {}
+        self._built_at = None
+
+        event.listen(engineer_model, 'after_insert', self._on_engineer_change)
+        event.listen(engineer_model, 'after_update', self._on_engineer_change)
+        event.listen(engineer_model, 'after_delete', self._on_engineer_delete)
+        event.listen(ticket_model, 'after_insert', self._on_ticket_insert)
+        event.listen(ticket_model, 'after_update', self._on_ticket_update)
+        event.listen(ticket_model, 'after_delete', self._on_ticket_delete)
+
+    def rebuild(self):
+        """Load engineers and their open-ticket counts from the database."""
+        Engineer, Ticket = self.Engineer, self.Ticket
+        session = self.db.session
+        engineers = session.query(Engineer.id, Engineer.expertise).all()
+        open_counts = dict(
+            session.query(Ticket.assigned_engineer, func.count(Ticket.id))
+            .filter(Ticket.assigned_engineer.isnot(None),
+                    Ticket.status.notin_(CLOSED_STATUSES))
+            .group_by(Ticket.assigned_engineer))
+        with self._lock:
+            self._loads = {engineer_id: open_counts.get(engineer_id, 0) + self._reserved[engineer_id]
+                           for engineer_id, _ in engineers}
+            self._expertise = dict(engineers)
+            self._heaps = {}
+            for engineer_id, expertise in engineers:
+                self._heaps.setdefault(expertise, []).append((self._loads[engineer_id], engineer_id))
+            for heap in self._heaps.values():
+                heapq.heapify(heap)
+            self._built_at = time.monotonic()
+
+    def load(self, engineer_id):
+        return self._loads.get(engineer_id, 0)
+
+    def _ensure_fresh(self):
+        if self._built_at is not None and time.monotonic() - self._built_at <= self.max_age:
+            return
+        # Only the first build makes others wait; later ones keep the current loads meanwhile
+        if self._build_lock.acquire(blocking=self._built_at is None):
+            try:
+                if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+                    self.rebuild()
+            finally:
+                self._build_lock.release()
+
+    def assign(self, expertise, session):
+        """Reserve and return the least-loaded engineer for `expertise`, or None."""
+        self._ensure_fresh()
+        with self._lock:
+            heap = self._heaps.get(expertise)
+            while heap:
+                load, engineer_id = heap[0]
+                if self._expertise.get(engineer_id) == expertise and self._loads.get(engineer_id) == load:
+                    break
+                heapq.heappop(heap)  # stale entry
+            else:
+                return None
+            self._reserved[engineer_id] += 1
+            self._change(engineer_id, 1)
+        session.info.setdefault('assignment_reservations', []).append((self, engineer_id))
+        return engineer_id
+
+    def _change(self, engineer_id, delta):
+        # Caller holds self._lock
+        if engineer_id not in self._loads:
+            return
+        self._loads[engineer_id] += delta
+        heap = self._heaps.setdefault(self._expertise[engineer_id], [])
+        heapq.heappush(heap, (self._loads[engineer_id], engineer_id))
+        if len(heap) > 2 * len(self._loads) + 64:
+            self._compact(self._expertise[engineer_id])
+
+    def _compact(self, expertise):
+        self._heaps[expertise] = [(load, engineer_id) for engineer_id, load in self._loads.items()
+                                  if self._expertise[engineer_id] == expertise]
+        heapq.heapify(self._heaps[expertise])
+
+    def _apply(self, changes):
+        with self._lock:
+            for change in changes:
+                if change[0] == 'load':
+                    self._change(change[1], change[2])
+                elif change[0] == 'release':
+                    self._reserved[change[1]] -= 1
+                    if not self._reserved[change[1]]:
+                        del self._reserved[change[1]]
+                    self._change(change[1], -1)
+                elif change[0] == 'engineer':
+                    _, engineer_id, expertise = change
+                    old = self._expertise.get(engineer_id)
+                    self._expertise[engineer_id] = expertise
+                    self._loads.setdefault(engineer_id, 0)
+                    self._change(engineer_id, 0)
+                    if old is not None and old != expertise:
+                        self._compact(old)
+                elif change[0] == 'remove':
+                    expertise = self._expertise.pop(change[1], None)
+                    self._loads.pop(change[1], None)
+                    if expertise is not None:
+                        self._compact(expertise)
+
+    # Flush-time listeners record changes on the session; they are applied on commit.
+
+    def _record(self, target, change):
+        session = object_session(target)
+        if session is not None and self._built_at is not None:
+            session.info.setdefault('assignment_changes', []).append((self, change))
+
+    def _on_engineer_change(self, mapper, connection, target):
+        self._record(target, ('engineer', target.id, target.expertise))
+
+    def _on_engineer_delete(self, mapper, connection, target):
+        self._record(target, ('remove', target.id))
+
+    def _on_ticket_insert(self, mapper, connection, target):
+        if target.assigned_engineer and target.status not in CLOSED_STATUSES:
+            self._record(target, ('load', int(target.assigned_engineer), 1))
+
+    def _on_ticket_update(self, mapper, connection, target):
+        state = inspect(target)
+        status = state.attrs.status.history
+        engineer = state.attrs.assigned_engineer.history
+        if not status.has_changes() and not engineer.has_changes():
+            return
+        old_status = status.deleted[0] if status.deleted else target.status
+        old_engineer = engineer.deleted[0] if engineer.deleted else target.assigned_engineer
+        if old_engineer and old_status not in CLOSED_STATUSES:
+            self._record(target, ('load', int(old_engineer), -1))
+        if target.assigned_engineer and target.status not in CLOSED_STATUSES:
+            self._record(target, ('load', int(target.assigned_engineer), 1))
+
+    def _on_ticket_delete(self, mapper, connection, target):
+        if target.assigned_engineer and target.status not in CLOSED_STATUSES:
+            self._record(target, ('load', int(target.assigned_engineer), -1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    # A reservation becomes the committed ticket's load, so release it first.
+    for engine, engineer_id in session.info.pop('assignment_reservations', ()):
+        engine._apply([('release', engineer_id)])
+    for engine, change in session.info.pop('assignment_changes', ()):
+        engine._apply([change])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _release_rolled_back(session):
+    session.info.pop('assignment_changes', None)
+    for engine, engineer_id in session.info.pop('assignment_reservations', ()):
+        engine._apply([('release', engineer_id)])
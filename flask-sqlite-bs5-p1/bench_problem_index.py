@@ -0,0 +1,98 @@
+"""Benchmark ProblemIndex against the old exact-match SQL lookup.
+
+Descriptions draw words from a Zipf-distributed vocabulary (a few very
+common words, a long tail of product names and error codes), like real
+support tickets.
+
+    python bench_problem_index.py --problems 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from problem_index import ProblemIndex
+
+SERVICES = ['মেইল', 'ইন্টারনেট', 'সফটওয়্যার']
+WORDS = [
+    'মেইল', 'পাঠানো', 'যাচ্ছে', 'ইনবক্স', 'পাসওয়ার্ড', 'লগইন', 'সংযোগ', 'ধীর', 'রাউটার', 'ওয়াইফাই',
+    'ইনস্টল', 'আপডেট', 'লাইসেন্স', 'প্রিন্টার', 'সার্ভার', 'বন্ধ', 'ত্রুটি', 'ফাইল', 'খুলছে', 'ডাউনলোড',
+    'outlook', 'smtp', 'imap', 'vpn', 'dns', 'timeout', 'error', 'crash', 'license', 'update',
+    'install', 'printer', 'password', 'reset', 'blocked', 'attachment', 'quota', 'latency', 'proxy',
+    'certificate', 'sync', 'calendar', 'backup', 'restore', 'driver', 'browser', 'cache', 'port',
+]
+
+VOCABULARY = WORDS + [f'{prefix}{n}' for prefix in ('err', 'model', 'host') for n in range(1000)]
+ZIPF_WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+
+def make_description(rng):
+    words = set(rng.choices(VOCABULARY, weights=ZIPF_WEIGHTS, k=rng.randint(5, 12)))
+    return ' '.join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--problems', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    options = parser.parse_args()
+    rng = random.Random(options.seed)
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE problem (id INTEGER PRIMARY KEY, service_type VARCHAR(50), '
+                     'description VARCHAR(200), solution VARCHAR(500), escalation_path VARCHAR(100))')
+        rows = [(i, rng.choice(SERVICES), make_description(rng), f'solution {i}')
+                for i in range(1, options.problems + 1)]
+        conn.executemany('INSERT INTO problem (id, service_type, description, solution) '
+                         'VALUES (?, ?, ?, ?)', rows)
+        conn.commit()
+
+        index = ProblemIndex(lambda: conn.execute(
+            'SELECT id, service_type, description, solution FROM problem'))
+        started = time.perf_counter()
+        index.rebuild()
+        build_seconds = time.perf_counter() - started
+
+        samples = rng.sample(rows, options.queries)
+        # Near-duplicates: same problem with one word dropped and the rest shuffled
+        near = []
+        for _, service_type, description, _ in samples:
+            words = description.split()
+            words.pop(rng.randrange(len(words)))
+            rng.shuffle(words)
+            near.append((service_type, ' '.join(words)))
+
+        def sql_lookup(service_type, description):
+            return conn.execute('SELECT id, solution FROM problem WHERE service_type = ? '
+                                'AND description = ? LIMIT 1', (service_type, description)).fetchone()
+
+        def index_lookup(service_type, description):
+            candidates = index.search(service_type, description, limit=1, min_score=0.8)
+            return candidates[0] if candidates else None
+
+        print(f'{options.problems} problems, index built in {build_seconds:.2f}s')
+        print(f'{"lookup":<8} {"queries":<15} {"mean ms":>9} {"hit rate":>9}')
+        for name, lookup in [('sql', sql_lookup), ('index', index_lookup)]:
+            for label, queries in [('exact', [(r[1], r[2]) for r in samples]),
+                                   ('near-duplicate', near)]:
+                hits = 0
+                started = time.perf_counter()
+                for service_type, description in queries:
+                    if lookup(service_type, description):
+                        hits += 1
+                elapsed = time.perf_counter() - started
+                print(f'{name:<8} {label:<15} {elapsed / len(queries) * 1000:>9.3f} '
+                      f'{hits / len(queries):>9.0%}')
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
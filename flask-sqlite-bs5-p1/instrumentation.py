@@ -0,0 +1,311 @@
+"""Latency histograms for requests, SQL statements and RabbitMQ publishes.
+
+    instrumentation = Instrumentation(app)
+
+    with PUBLISH_LATENCY.time(queue_name, 'message'):
+        channel.basic_publish(...)
+
+Every request is timed per endpoint, and the SQL it runs is added up per
+request. With SQLAlchemy installed, every statement is also timed under its
+fingerprint: literals and bind lists collapsed, so `IN (?, ?, ?)` and
+`IN (?)` count as one statement. Statement time covers execute() only, not
+fetching the rows afterwards. Everything is served in Prometheus text
+format on GET /metrics. Each process keeps its own histograms, so with
+several workers every worker is scraped (or summed) separately.
+
+Metrics show SQL and timings, so both endpoints refuse anonymous requests
+with 403. A request is let in when it sends `Authorization: Bearer
+<METRICS_TOKEN>` (for a scraper), or when `authorize()` returns true, e.g.
+a check that the logged-in user is an admin:
+
+    Instrumentation(app, authorize=lambda: current_user.is_authenticated
+                    and current_user.role == 'admin')
+
+Listing endpoints in METRICS_PROFILE_ENDPOINTS turns on a sampling
+profiler for requests to them. Every METRICS_PROFILE_INTERVAL seconds the
+stacks of threads serving such requests are recorded. GET /metrics/profile
+returns them as collapsed stacks for flamegraph.pl or speedscope, and POST
+returns them and clears them. The list is read on every request, so it can be
+changed while the app runs.
+
+Each app runs from its own directory, so this module is copied into every
+app that uses it. Edit the flask-sqlite-bs5-p2 copy and copy it over;
+flask-sqlite-bs5-p2/test_shared_modules.py fails while the copies differ.
+"""
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_app_context, request
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_FINGERPRINTS = 500  # later statements are counted as 'other'
+MAX_FINGERPRINT_LENGTH = 300
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Thread-safe labelled histogram, rendered in Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(labels, time.perf_counter() - started)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((labels, list(counts), total)
+                              for labels, (counts, total) in self._series.items())
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        for labels, counts, total in snapshot:
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + bound + '"'
+                lines.append(f'{self.name}_bucket{{{",".join(pairs + [le])}}} {cumulative}')
+            label_text = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{self.name}_sum{label_text} {total!r}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds',
+                            'Time until the view returned a response.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_SQL_TIME = Histogram('http_request_sql_duration_seconds',
+                             'Total SQL execute time per request.', ('endpoint',))
+SQL_LATENCY = Histogram('sql_statement_duration_seconds',
+                        'SQL execute time per statement fingerprint.', ('statement',))
+PUBLISH_LATENCY = Histogram('rabbitmq_publish_duration_seconds',
+                            'RabbitMQ publish time per message or per committed batch.',
+                            ('queue', 'kind'))
+HISTOGRAMS = [REQUEST_LATENCY, REQUEST_SQL_TIME, SQL_LATENCY, PUBLISH_LATENCY]
+
+
+_QUOTED = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_BIND_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROW_LIST = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_SPACE = re.compile(r'\s+')
+_fingerprints = {}  # statement -> label
+_labels = set()
+_fingerprint_lock = threading.Lock()
+
+
+def fingerprint(statement):
+    """Collapse literals and bind lists so variants of one statement share a label."""
+    known = _fingerprints.get(statement)
+    if known is not None:
+        return known
+    text = _SPACE.sub(' ', statement).strip()
+    text = _NUMBER.sub('?', _QUOTED.sub('?', text))
+    text = _ROW_LIST.sub('(?)', _BIND_LIST.sub('(?)', text))[:MAX_FINGERPRINT_LENGTH]
+    with _fingerprint_lock:
+        if text not in _labels:
+            if len(_labels) >= MAX_FINGERPRINTS:
+                text = 'other'
+            else:
+                _labels.add(text)
+        if len(_fingerprints) > 10 * MAX_FINGERPRINTS:
+            # Statements with inlined values never repeat; keep only the labels
+            _fingerprints.clear()
+        _fingerprints[statement] = text
+    return text
+
+
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('statement_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    SQL_LATENCY.observe((fingerprint(statement),), elapsed)
+    if has_app_context() and 'sql_seconds' in g:
+        g.sql_seconds += elapsed
+
+
+def _statement_failed(context):
+    if context.connection is not None:
+        started = context.connection.info.get('statement_started')
+        if started:
+            started.pop()
+
+
+_listening = False
+
+
+def _listen_for_statements():
+    global _listening
+    if _listening:
+        return
+    try:
+        from sqlalchemy import event  # optional: apps without SQLAlchemy get request timing only
+        from sqlalchemy.engine import Engine
+    except ImportError:
+        return
+    event.listen(Engine, 'before_cursor_execute', _statement_started)
+    event.listen(Engine, 'after_cursor_execute', _statement_finished)
+    event.listen(Engine, 'handle_error', _statement_failed)
+    _listening = True
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Records the stacks of registered threads every `interval` seconds."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._threads = {}  # thread id -> endpoint
+        self._active = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, thread_id, endpoint):
+        with self._lock:
+            self._threads[thread_id] = endpoint
+            self._active.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler',
+                                                daemon=True)
+                self._thread.start()
+
+    def remove(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+            if not self._threads:
+                self._active.clear()
+
+    def collapsed(self, reset=False):
+        """Return 'endpoint;frame;frame... count' lines, most sampled first."""
+        with self._lock:
+            samples = self.samples.most_common()
+            if reset:
+                self.samples.clear()
+        return [f'{endpoint};{stack} {count}' for (endpoint, stack), count in samples]
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                threads = list(self._threads.items())
+            frames = sys._current_frames()
+            stacks = [(endpoint, _stack(frames[thread_id]))
+                      for thread_id, endpoint in threads if thread_id in frames]
+            with self._lock:
+                self.samples.update(stacks)
+
+
+class Instrumentation:
+
+    def __init__(self, app=None, authorize=None):
+        self.profiler = None
+        self.authorize = authorize
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_TOKEN', None)  # None = only authorize() lets requests in
+        app.config.setdefault('METRICS_PROFILE_ENDPOINTS', ())
+        app.config.setdefault('METRICS_PROFILE_INTERVAL', 0.005)  # seconds between samples
+        self.app = app
+        self.profiler = SamplingProfiler(app.config['METRICS_PROFILE_INTERVAL'])
+        _listen_for_statements()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.metrics)
+        app.add_url_rule('/metrics/profile', 'metrics_profile', self.profile, methods=['GET', 'POST'])
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.sql_seconds = 0.0
+        if request.endpoint in self.app.config['METRICS_PROFILE_ENDPOINTS']:
+            g.profiled = True
+            self.profiler.add(threading.get_ident(), request.endpoint)
+
+    def _observe(self, status):
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe((endpoint, request.method, str(status)), time.perf_counter() - started)
+        sql_seconds = g.pop('sql_seconds', 0.0)
+        if _listening:
+            REQUEST_SQL_TIME.observe((endpoint,), sql_seconds)
+        if g.pop('profiled', False):
+            self.profiler.remove(threading.get_ident())
+
+    def _finish(self, response):
+        # Timed when the view returns, so a streamed response counts until its first byte
+        self._observe(response.status_code)
+        return response
+
+    def _teardown(self, exc):
+        # after_request does not run when the view raised
+        self._observe(500)
+
+    def _check_access(self):
+        token = self.app.config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode()):
+            return
+        if self.authorize is None or not self.authorize():
+            abort(403)
+
+    def metrics(self):
+        self._check_access()
+        lines = [line for histogram in HISTOGRAMS for line in histogram.render()]
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    def profile(self):
+        self._check_access()
+        lines = self.profiler.collapsed(reset=request.method == 'POST')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain')
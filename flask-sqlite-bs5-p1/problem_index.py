@@ -0,0 +1,257 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+Candidate = namedtuple('Candidate', 'score problem_id solution description')
+
+# বাংলা ব্লক (U+0980-U+09FF) সহ, যাতে কার/চিহ্ন শব্দ থেকে আলাদা না হয়
+TOKEN_RE = re.compile(r'[0-9a-z\u0980-\u09ff]+')
+BENGALI_DIGITS = str.maketrans('০১২৩৪৫৬৭৮৯', '0123456789')
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'be', 'but', 'for', 'i', 'in', 'is', 'it', 'my', 'of', 'on',
+    'or', 'the', 'to', 'was', 'with',
+    'আমার', 'আমি', 'এবং', 'এই', 'একটি', 'কিন্তু', 'করে', 'করছে', 'হচ্ছে', 'হয়', 'না', 'ও', 'যে',
+}
+# Tokens in more than this share of a service's problems barely change the ranking
+COMMON_TOKEN_RATIO = 0.2
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFC', text or '').casefold()
+    # ZWJ/ZWNJ only change how a conjunct is drawn, not the word
+    text = text.replace('\u200c', '').replace('\u200d', '')
+    return text.translate(BENGALI_DIGITS)
+
+
+_STOPWORDS = {normalize(word) for word in STOPWORDS}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(normalize(text)) if token not in _STOPWORDS]
+
+
+class ProblemIndex:
+    """In-memory inverted index over Problem.description, one per service_type.
+
+    Built on the first search and kept current from commits in this
+    process. Once it is `max_age` seconds old, a search starts a full
+    rebuild on a background thread, which picks up changes made by other
+    worker processes; searches keep using the current index until the new
+    one is swapped in. Only the very first search waits for a build.
+    """
+
+    def __init__(self, loader, max_age=300):
+        # loader() -> iterable of (id, service_type, description, solution);
+        # called from a background thread too, so it must not need request state
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()  # one build at a time
+        self._postings = {}
+        self._sizes = defaultdict(int)
+        self._docs = {}
+        self._built_at = None
+        self._pending = None  # changes committed while a build runs, replayed onto it
+        self._refreshing = False
+
+    def _load(self):
+        postings = defaultdict(lambda: defaultdict(set))
+        sizes = defaultdict(int)
+        docs = {}
+        for problem_id, service_type, description, solution in self.loader():
+            tokens = frozenset(tokenize(description))
+            docs[problem_id] = (service_type, tokens, solution, description)
+            sizes[service_type] += 1
+            for token in tokens:
+                postings[service_type][token].add(problem_id)
+        return postings, sizes, docs
+
+    def rebuild(self):
+        """Re-read every problem. Searches use the current index until it is done."""
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            built = self._load()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._postings, self._sizes, self._docs = built
+            self._built_at = time.monotonic()
+            # Commits the loader may not have seen; add and remove are idempotent
+            for change, row in self._pending:
+                self._apply(change, row)
+            self._pending = None
+
+    def invalidate(self):
+        """Rebuild in the background; searches keep using the current index meanwhile."""
+        if self._built_at is not None:
+            self._refresh_in_background()
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            # Nothing to search yet, so wait; concurrent first searches share one build
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild()
+        elif time.monotonic() - self._built_at > self.max_age:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                # The old index stays in use; the next stale search tries again
+                logger.exception('Problem index rebuild failed')
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=run, name='problem-index-rebuild', daemon=True).start()
+
+    def _apply(self, change, row):
+        if change == 'add':
+            self._add(*row)
+        else:
+            self._remove(row[0])
+
+    def _change(self, change, row):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((change, row))
+            if self._built_at is not None:
+                self._apply(change, row)
+
+    def add(self, problem_id, service_type, description, solution):
+        self._change('add', (problem_id, service_type, description, solution))
+
+    def _add(self, problem_id, service_type, description, solution):
+        self._remove(problem_id)
+        tokens = frozenset(tokenize(description))
+        self._docs[problem_id] = (service_type, tokens, solution, description)
+        self._sizes[service_type] += 1
+        service = self._postings.setdefault(service_type, defaultdict(set))
+        for token in tokens:
+            service[token].add(problem_id)
+
+    def remove(self, problem_id):
+        self._change('remove', (problem_id,))
+
+    def _remove(self, problem_id):
+        doc = self._docs.pop(problem_id, None)
+        if doc is None:
+            return
+        self._sizes[doc[0]] -= 1
+        service = self._postings.get(doc[0], {})
+        for token in doc[1]:
+            ids = service.get(token)
+            if ids is not None:
+                ids.discard(problem_id)
+                if not ids:
+                    del service[token]
+
+    def search(self, service_type, text, limit=5, min_score=0.0):
+        """Rank problems of `service_type` by weighted token overlap with `text`.
+
+        The score is a Dice coefficient over IDF-weighted tokens: 1.0 for the
+        same set of words, lower as words are missing or extra. With
+        `min_score`, only the rarest query tokens are used to find candidates
+        (prefix filtering): a problem sharing none of them cannot reach the
+        threshold, so the long posting lists of common words are never walked.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            service = self._postings.get(service_type)
+            query = set(tokenize(text))
+            if not service or not query:
+                return []
+            total = self._sizes[service_type]
+
+            def idf(token):
+                return math.log(1 + total / (len(service.get(token, ())) or 1))
+
+            weights = {token: idf(token) for token in query}
+            query_weight = sum(weights.values())
+            ordered = sorted(query, key=lambda token: len(service.get(token, ())))
+            prefix = ordered
+            if min_score > 0:
+                # Dice >= s needs an overlap of at least s * Wq / (2 - s)
+                slack = query_weight - min_score * query_weight / (2 - min_score)
+                covered = 0.0
+                for position, token in enumerate(ordered):
+                    covered += weights[token]
+                    if covered > slack:
+                        prefix = ordered[:position + 1]
+                        break
+
+            candidates = set().union(*(service.get(token, ()) for token in prefix))
+            matched = defaultdict(float)
+            for token in query:
+                ids = service.get(token)
+                if ids:
+                    for problem_id in (ids & candidates if token not in prefix else ids):
+                        matched[problem_id] += weights[token]
+
+            results = []
+            for problem_id, overlap in matched.items():
+                if problem_id not in candidates:
+                    continue
+                tokens = self._docs[problem_id][1]
+                if min_score > 0 and 2 * overlap / (query_weight + overlap) < min_score:
+                    continue  # cannot pass even if it had no extra words
+                doc_weight = sum(idf(token) for token in tokens)
+                score = 2 * overlap / (query_weight + doc_weight)
+                if score >= min_score:
+                    _, _, solution, description = self._docs[problem_id]
+                    results.append(Candidate(score, problem_id, solution, description))
+            return heapq.nsmallest(limit, results,
+                                   key=lambda candidate: (-candidate.score, candidate.problem_id))
+
+    def track(self, model):
+        """Keep the index in step with committed inserts, updates and deletes of `model`."""
+        def mark(change):
+            def listener(mapper, connection, target):
+                session = object_session(target)
+                if session is None:
+                    return
+                row = (target.id, target.service_type, target.description, target.solution)
+                session.info.setdefault('problem_index_changes', []).append((self, change, row))
+            return listener
+
+        event.listen(model, 'after_insert', mark('add'))
+        event.listen(model, 'after_update', mark('add'))
+        event.listen(model, 'after_delete', mark('remove'))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    for index, change, row in session.info.pop('problem_index_changes', ()):
+        if change == 'add':
+            index.add(*row)
+        else:
+            index.remove(row[0])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('problem_index_changes', None)
@@ -0,0 +1,72 @@
+"""Run with: python -m pytest test_app.py"""
+import os
+
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ['FLASK_TESTING'] = 'true'  # also makes QueryBudget raise instead of log
+
+import pytest
+
+import assignment as assignment_module
+from app import app, db, Customer, Engineer, Ticket
+from assignment import AssignmentEngine
+
+
+@pytest.fixture
+def ticket_ids():
+    with app.app_context():
+        db.create_all()
+        customer = Customer(name='Customer')
+        engineers = [Engineer(name=f'Engineer {i}', expertise='Email', contact='0171XXXXXXX')
+                     for i in range(3)]
+        db.session.add_all([customer, *engineers])
+        db.session.flush()
+        tickets = [Ticket(customer_id=customer.id, service_type='Email',
+                          problem_description=f'Problem {i}', assigned_engineer=engineers[i % 3].id)
+                   for i in range(6)]
+        db.session.add_all(tickets)
+        db.session.commit()
+        ids = [ticket.id for ticket in tickets]
+    # Requests get a fresh session; one left open here would answer lazy loads from memory
+    yield ids
+    with app.app_context():
+        db.drop_all()
+
+
+def test_dashboard_renders_within_query_budget(ticket_ids):
+    response = app.test_client().get('/')
+
+    assert response.status_code == 200
+    assert response.headers['X-Query-Count'] == '1'
+
+
+def test_view_ticket_renders_within_query_budget(ticket_ids):
+    response = app.test_client().get(f'/ticket/{ticket_ids[1]}')
+
+    assert response.status_code == 200
+    assert 'Engineer 1' in response.get_data(as_text=True)
+
+
+def test_missing_ticket_is_404(ticket_ids):
+    assert app.test_client().get('/ticket/999').status_code == 404
+
+
+def test_assignment_counts_tickets_assigned_by_other_processes(ticket_ids, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(assignment_module.time, 'monotonic', lambda: now[0])
+    with app.app_context():
+        engine = AssignmentEngine(db, Engineer, Ticket, max_age=30)
+        engine.rebuild()
+        first, second, third = [engineer.id for engineer in Engineer.query.order_by(Engineer.id)]
+        # Another process assigns more tickets: a Core INSERT, so no ORM events here
+        db.session.execute(db.insert(Ticket), [{'service_type': 'Email', 'status': 'Open',
+                                                 'assigned_engineer': engineer_id}
+                                                for engineer_id in (first, second) for _ in range(3)])
+        db.session.commit()
+
+        assert engine.assign('Email', db.session) == first
+        db.session.rollback()
+
+        now[0] += 31
+        assert engine.assign('Email', db.session) == third
+        db.session.rollback()
+        assert engine.load(third) == 2
@@ -1,15 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+import io
+import time
+
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy import case, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from cache import make_cache, invalidate_on_change
+from query_budget import QueryBudget
+from instrumentation import Instrumentation
+from notifications import NotificationPipeline
+from dispatch import Dispatcher
+import bulk
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///p3.db'
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this for production
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['USER_CACHE_TTL'] = 60
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['NOTIFICATION_RABBITMQ_HOST'] = None  # None = background thread in the web process
+app.config['DISPATCH_RABBITMQ_HOST'] = None  # None = engineers pick tickets from the dashboard
+app.config['DISPATCH_POOLS'] = {'general': ['*']}  # engineer pool -> services it handles
+app.config['DISPATCH_DEPTHS_TTL'] = 5  # seconds the dashboard's queue counts are reused
+app.config['METRICS_PROFILE_ENDPOINTS'] = []  # e.g. ['dashboard'] to sample its stacks
+# Environment variables starting with FLASK_ override the config, e.g. FLASK_SQLALCHEMY_DATABASE_URI
+app.config.from_prefixed_env()
 db = SQLAlchemy(app)
+query_budget = QueryBudget(app)
+# Route, SQL and RabbitMQ publish latency on /metrics, for admins or FLASK_METRICS_TOKEN
+instrumentation = Instrumentation(app, authorize=lambda: current_user.is_authenticated
+                                  and current_user.role == 'admin')
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -38,6 +63,8 @@ class Service(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
 
+TICKET_PRIORITIES = {'Urgent': 3, 'High': 2, 'Normal': 1}
+
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
@@ -49,12 +76,70 @@ class Ticket(db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     engineer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, onupdate=lambda: datetime.now(datetime.timezone.utc))
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    customer = db.relationship('User', foreign_keys=[customer_id])
+    engineer = db.relationship('User', foreign_keys=[engineer_id])
+
+# Service Cache (the dropdown list rarely changes)
+cache = make_cache(app)
+SERVICES_CACHE_KEY = 'services'
+invalidate_on_change(Service, cache, SERVICES_CACHE_KEY)
+
+def get_services():
+    services = cache.get(SERVICES_CACHE_KEY)
+    if services is None:
+        services = [{'id': service.id, 'name': service.name}
+                    for service in Service.query.order_by(Service.id)]
+        cache.set(SERVICES_CACHE_KEY, services)
+    return services
+
+# Notification fan-out: who hears about each ticket event
+def notification_recipients(event):
+    ticket_id = event['ticket_id']
+    if event['type'] == 'resolved':
+        return [(event['customer_id'], f'Ticket #{ticket_id} has been resolved')]
+    return []
+
+notifications = NotificationPipeline(app, db, Notification, notification_recipients)
+
+def emit_ticket_event(event_type, ticket):
+    notifications.emit(db.session, {
+        'type': event_type,
+        'ticket_id': ticket.id,
+        'customer_id': ticket.customer_id,
+        'engineer_id': ticket.engineer_id,
+    })
+
+# Ticket Dispatch (new tickets are queued per service; engineers take the next one)
+def claim_ticket(ticket_id, engineer_id):
+    # Only one engineer can move an Open, unassigned ticket to In Progress
+    result = db.session.execute(
+        update(Ticket)
+        .where(Ticket.id == ticket_id, Ticket.status == 'Open', Ticket.engineer_id.is_(None))
+        .values(engineer_id=engineer_id, status='In Progress'))
+    db.session.commit()
+    return result.rowcount == 1
+
+dispatcher = Dispatcher(app, TICKET_PRIORITIES, claim_ticket)
+
+# User Loader (identity is cached so authenticated requests skip the database)
+USER_CACHE_FIELDS = ('id', 'email', 'role', 'name')
+user_cache = make_cache(app, ttl=app.config['USER_CACHE_TTL'],
+                        maxsize=app.config['USER_CACHE_SIZE'], prefix='ticketing:user:')
+invalidate_on_change(User, user_cache, lambda user: str(user.id))
 
-# User Loader
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    data = user_cache.get(user_id)
+    if data is None:
+        user = db.session.get(User, int(user_id))
+        if user is not None:
+            user_cache.set(user_id, {field: getattr(user, field) for field in USER_CACHE_FIELDS})
+        return user
+    # Attach without a query; other columns (password, created_at) load on first access
+    user = User(**data)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
 
 # Common Validation Function
 def validate_registration(email, password, name):
@@ -130,14 +215,22 @@ def logout():
 # Dashboard and Ticket Management Routes
 @app.route('/dashboard')
 @login_required
+@query_budget.limit(2)
 def dashboard():
     try:
+        # Load customer and engineer names in the same query instead of one query per row
+        query = Ticket.query.options(joinedload(Ticket.customer), joinedload(Ticket.engineer))
         if current_user.role == 'customer':
-            tickets = Ticket.query.filter_by(customer_id=current_user.id).order_by(Ticket.created_at.desc()).all()
+            tickets = query.filter_by(customer_id=current_user.id).order_by(Ticket.created_at.desc()).all()
         elif current_user.role == 'engineer':
-            tickets = Ticket.query.filter_by(engineer_id=current_user.id).order_by(Ticket.priority.desc()).all()
+            # Rank priorities by level; ordering the names would put Normal above High
+            priority_rank = case(TICKET_PRIORITIES, value=Ticket.priority, else_=0)
+            tickets = query.filter_by(engineer_id=current_user.id).order_by(
+                priority_rank.desc(), Ticket.created_at).all()
+            return render_template('engineer_dashboard.html', tickets=tickets,
+                                   dispatch_depths=dispatcher.depths() if dispatcher.enabled else None)
         elif current_user.role == 'admin':
-            tickets = Ticket.query.order_by(Ticket.created_at.desc()).all()
+            tickets = query.order_by(Ticket.created_at.desc()).all()
         else:
             return redirect(url_for('login'))
             
@@ -175,6 +268,9 @@ def create_ticket():
             )
             
             db.session.add(new_ticket)
+            db.session.flush()
+            # Queued for engineers once this commits
+            dispatcher.emit(db.session, new_ticket)
             db.session.commit()
             flash('Ticket created successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -184,7 +280,7 @@ def create_ticket():
             app.logger.error(f'Ticket creation error: {str(e)}')
             flash('There was an issue creating the ticket', 'danger')
 
-    services = Service.query.all()
+    services = get_services()
     return render_template('create_ticket.html', services=services)
 
 @app.route('/ticket/<int:ticket_id>/edit', methods=['GET', 'POST'])
@@ -199,7 +295,11 @@ def edit_ticket(ticket_id):
     if request.method == 'POST':
         ticket.title = request.form.get('title', ticket.title).strip()
         ticket.description = request.form.get('description', ticket.description).strip()
+        old_priority = ticket.priority
         ticket.priority = request.form.get('priority', ticket.priority)
+        if ticket.priority != old_priority and ticket.status == 'Open' and ticket.engineer_id is None:
+            # Queue it again at the new priority; the old message is skipped once it is claimed
+            dispatcher.emit(db.session, ticket)
         
         try:
             db.session.commit()
@@ -210,13 +310,15 @@ def edit_ticket(ticket_id):
             app.logger.error(f'Ticket update error: {str(e)}')
             flash('There was an issue updating the ticket.', 'danger')
 
-    services = Service.query.all()
+    services = get_services()
     return render_template('edit_ticket.html', ticket=ticket, services=services)
 
 @app.route('/ticket/<int:ticket_id>')
 @login_required
+@query_budget.limit(2)
 def view_ticket(ticket_id):
-    ticket = Ticket.query.get_or_404(ticket_id)
+    ticket = db.get_or_404(Ticket, ticket_id,
+                           options=[joinedload(Ticket.customer), joinedload(Ticket.engineer)])
 
     if current_user.role == 'customer' and ticket.customer_id != current_user.id:
         flash('Permission denied', 'danger')
@@ -245,12 +347,8 @@ def resolve_ticket(ticket_id):
         ticket.status = 'Resolved'
         ticket.engineer_id = current_user.id
 
-        notification = Notification(
-            content=f'Ticket #{ticket_id} has been resolved',
-            user_id=ticket.customer_id
-        )
-
-        db.session.add(notification)
+        # Notifications are written in the background once this commits
+        emit_ticket_event('resolved', ticket)
         db.session.commit()
         flash('Ticket resolved successfully!', 'success')
     except Exception as e:
@@ -260,6 +358,45 @@ def resolve_ticket(ticket_id):
 
     return redirect(url_for("view_ticket", ticket_id=ticket_id))
 
+@app.route('/ticket/<int:ticket_id>/confirm', methods=['POST'])
+@login_required
+def confirm_ticket(ticket_id):
+    ticket = Ticket.query.get_or_404(ticket_id)
+
+    if current_user.role != 'customer' or ticket.customer_id != current_user.id:
+        flash('Permission denied', 'danger')
+        return redirect(url_for('dashboard'))
+
+    if ticket.status == 'Resolved':
+        ticket.status = 'Confirmed'
+        db.session.commit()
+        flash('Thank you for confirming the solution', 'success')
+
+    return redirect(url_for("view_ticket", ticket_id=ticket_id))
+
+@app.route('/dispatch/next', methods=['POST'])
+@login_required
+def take_next_ticket():
+    if current_user.role != 'engineer' or not dispatcher.enabled:
+        flash('Permission denied', 'danger')
+        return redirect(url_for('dashboard'))
+
+    pool = request.form.get('pool', '')
+    if pool not in dispatcher.pools:
+        abort(400)
+    try:
+        ticket_id = dispatcher.next_ticket(pool, current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Dispatch error: {str(e)}')
+        flash('There was an issue taking the next ticket', 'danger')
+        return redirect(url_for('dashboard'))
+
+    if ticket_id is None:
+        flash('No tickets are waiting in this queue', 'info')
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('view_ticket', ticket_id=ticket_id))
+
 @app.route('/notification/<int:notification_id>/mark-read')
 @login_required
 def mark_notification_read(notification_id):
@@ -275,6 +412,51 @@ def mark_notification_read(notification_id):
     flash("Notification marked as read", "success")
     return redirect(url_for("profile"))
 
+@app.route('/cache/stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'admin':
+        flash('Permission denied', 'danger')
+        return redirect(url_for('dashboard'))
+    return jsonify(users=user_cache.stats(), services=cache.stats())
+
+# Bulk Import/Export (CSV or JSONL)
+BULK_MODELS = {'tickets': Ticket, 'users': User}
+
+def bulk_format(filename=None):
+    # ?format= over HTTP, the file extension on the command line
+    if filename is None:
+        fmt = request.args.get('format', 'csv')
+    else:
+        fmt = 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+    return fmt if fmt in bulk.FORMATS else 'csv'
+
+@app.route('/export/<any(tickets, users):kind>')
+@login_required
+def export_table(kind):
+    if current_user.role != 'admin':
+        abort(403)
+    fmt = bulk_format()
+    model = BULK_MODELS[kind]
+    lines = bulk.encode(bulk.export_rows(db, model), bulk.columns_of(model), fmt)
+    return Response(stream_with_context(lines), mimetype=bulk.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
+@app.route('/import/<any(tickets, users):kind>', methods=['POST'])
+@login_required
+def import_table(kind):
+    if current_user.role != 'admin':
+        abort(403)
+    # The request body is read line by line, never held in memory whole
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    started = time.perf_counter()
+    try:
+        imported = bulk.import_rows(db, BULK_MODELS[kind], bulk.parse(lines, bulk_format()))
+    except (ValueError, SQLAlchemyError) as e:
+        app.logger.error(f'Import error: {str(e)}')
+        return jsonify(error=str(e).splitlines()[0]), 400
+    return jsonify(imported=imported, seconds=round(time.perf_counter() - started, 3))
+
 # Database Setup Command (optional for initial setup)
 @app.cli.command("init-db")
 def init_db():
@@ -293,6 +475,36 @@ def init_db():
                 db.session.add(service)
             db.session.commit()
 
+@app.cli.command("dispatch-requeue")
+def dispatch_requeue_command():
+    """Queue every Open, unassigned ticket again (e.g. ones created before dispatch was enabled)."""
+    if not dispatcher.enabled:
+        raise click.ClickException('Set DISPATCH_RABBITMQ_HOST to use dispatch')
+    tickets = Ticket.query.filter(Ticket.status == 'Open', Ticket.engineer_id.is_(None)).yield_per(1000)
+    click.echo(f"Queued {dispatcher.requeue(tickets)} tickets")
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(sorted(BULK_MODELS)))
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--with-passwords", is_flag=True, help="include password hashes")
+def export_command(kind, output, with_passwords):
+    """Write all tickets or users as CSV or JSONL (by file extension)."""
+    model = BULK_MODELS[kind]
+    for line in bulk.encode(bulk.export_rows(db, model), bulk.columns_of(model, with_passwords),
+                            bulk_format(output.name)):
+        output.write(line)
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(sorted(BULK_MODELS)))
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--with-passwords", is_flag=True, help="accept a password hash column")
+def import_command(kind, source, with_passwords):
+    """Load tickets or users from a CSV or JSONL file."""
+    started = time.perf_counter()
+    imported = bulk.import_rows(db, BULK_MODELS[kind], bulk.parse(source, bulk_format(source.name)),
+                                secrets=with_passwords)
+    click.echo(f"Imported {imported} {kind} in {time.perf_counter() - started:.2f}s")
+
 if __name__ == '__main__':
     with app.app_context():
         # Ensure database tables are created on startup.
@@ -0,0 +1,160 @@
+"""Streaming CSV/JSONL export and chunked import of whole tables.
+
+Exports read with yield_per and yield one encoded line at a time, so memory
+stays flat however many rows there are. Imports parse lazily and insert
+`chunk_size` rows per executemany, all in one transaction: either the
+whole file is imported or nothing is.
+
+Columns in SECRET_COLUMNS (password hashes) are left out of exports and
+refused by imports unless `secrets=True` is passed, which only the CLI
+commands do, behind an explicit flag.
+
+Each app runs from its own directory, so this module is copied into every
+app that uses it. Edit the flask-sqlite-bs5-p2 copy and copy it over;
+flask-sqlite-bs5-p2/test_shared_modules.py fails while the copies differ.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from itertools import islice
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXPORT_CHUNK = 1000
+IMPORT_CHUNK = 5000
+SECRET_COLUMNS = {'password'}
+
+
+def columns_of(model, secrets=False):
+    return [column.name for column in model.__table__.columns
+            if secrets or column.name not in SECRET_COLUMNS]
+
+
+def export_rows(db, model, chunk_size=EXPORT_CHUNK):
+    """Yield every row of `model` as a dict, in primary key order."""
+    table = model.__table__
+    result = db.session.execute(
+        select(table).order_by(*table.primary_key.columns)
+        .execution_options(yield_per=chunk_size))
+    for row in result:
+        yield dict(row._mapping)
+
+
+def _text(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def to_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(columns)
+    for row in rows:
+        yield line(['' if row[name] is None else _text(row[name]) for name in columns])
+
+
+def to_jsonl(rows, columns):
+    for row in rows:
+        yield json.dumps({name: _text(row[name]) for name in columns}, ensure_ascii=False) + '\n'
+
+
+def encode(rows, columns, fmt):
+    return (to_csv if fmt == 'csv' else to_jsonl)(rows, columns)
+
+
+def parse(lines, fmt):
+    """Yield dicts from an iterable of text lines."""
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    else:
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f'line {number}: {e}') from None
+
+
+def _converter(column):
+    column_type = column.type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column_type, Date):
+        return date.fromisoformat
+    if isinstance(column_type, Boolean):
+        return lambda value: value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, Float):
+        return float
+    return lambda value: value
+
+
+def _default(column):
+    # executemany sends every key of the first row, so defaults are filled in here
+    default = column.default
+    if default is None:
+        return lambda: None
+    if default.is_callable:
+        return lambda: default.arg(None)
+    return lambda: default.arg
+
+
+def import_rows(db, model, rows, chunk_size=IMPORT_CHUNK, secrets=False):
+    """Insert dicts from `rows` into `model`'s table. Returns the row count.
+
+    Keys must be column names and the first row decides which columns are
+    loaded. Missing or empty values get the column's default, or NULL if it
+    has none. Secret columns raise ValueError unless `secrets` is true.
+    """
+    table = model.__table__
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    unknown = set(first) - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f'unknown columns for {table.name}: {", ".join(sorted(unknown))}')
+    secret = set(first) & SECRET_COLUMNS
+    if secret and not secrets:
+        raise ValueError(f'secret columns for {table.name} are not imported: {", ".join(sorted(secret))}')
+    converters = {name: _converter(table.columns[name]) for name in first}
+    defaults = {name: _default(table.columns[name]) for name in first}
+
+    def convert(row):
+        values = {}
+        for name, to_python in converters.items():
+            value = row.get(name)
+            values[name] = defaults[name]() if value is None or value == '' else to_python(value)
+        return values
+
+    converted = map(convert, _prepend(first, rows))
+    total = 0
+    try:
+        while True:
+            chunk = list(islice(converted, chunk_size))
+            if not chunk:
+                break
+            db.session.execute(table.insert(), chunk)
+            total += len(chunk)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return total
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
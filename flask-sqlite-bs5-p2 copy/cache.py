@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+
+class CacheStats:
+    hits = 0
+    misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None}
+
+
+class TTLCache(CacheStats):
+    """Thread-safe in-process cache; entries expire after `ttl` seconds.
+
+    With `maxsize`, the least recently used entry is evicted once full.
+    """
+
+    def __init__(self, ttl=300, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache(CacheStats):
+    """Cache shared by every worker process. Values must be JSON-serializable."""
+
+    def __init__(self, url, ttl=300, prefix='ticketing:'):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def make_cache(app, ttl=None, maxsize=None, prefix='ticketing:'):
+    if ttl is None:
+        ttl = app.config.get('CACHE_TTL', 300)
+    if app.config.get('CACHE_REDIS_URL'):
+        # Redis bounds itself with maxmemory; entries still expire after ttl
+        return RedisCache(app.config['CACHE_REDIS_URL'], ttl, prefix)
+    return TTLCache(ttl, maxsize)
+
+
+def invalidate_on_change(model, cache, key):
+    """Drop `key` from `cache` once a transaction touching `model` commits.
+
+    `key` may be a function of the changed row, for per-row entries.
+    Invalidating at commit rather than at flush stops another request from
+    re-caching the old rows while the change is still uncommitted.
+    """
+    def mark(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('invalidate_cache_keys', set()).add(
+                (cache, key(target) if callable(key) else key))
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, mark)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for cache, key in session.info.pop('invalidate_cache_keys', ()):
+        cache.delete(key)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('invalidate_cache_keys', None)
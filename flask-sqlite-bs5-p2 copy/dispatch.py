@@ -0,0 +1,251 @@
+"""Push new tickets to engineers through RabbitMQ priority queues.
+
+Tickets are published to the ticket_dispatch topic exchange with the
+routing key ticket.<service> and their priority as the message priority.
+Each pool in DISPATCH_POOLS is a durable queue, dispatch.<pool>, declared
+with x-max-priority and bound to the services it handles, so one ticket
+reaches every pool that covers its service and each pool hands out
+Urgent tickets before High and Normal ones:
+
+    app.config['DISPATCH_POOLS'] = {'network': ['Email', 'Internet'],
+                                    'desk': ['Software', 'Hardware']}
+
+A service of '*' matches every service. Bindings are only ever added:
+a service taken out of a pool has to be unbound in RabbitMQ as well.
+
+Publishing happens after the request's transaction commits, from the
+same kind of I/O thread as the notification transport. Engineers pull
+with Dispatcher.next_ticket(): it takes the next message from the pool,
+claims the ticket with claim(ticket_id, engineer_id) and only then acks.
+claim must succeed for exactly one caller (a conditional UPDATE), so a
+ticket published twice, already claimed from another pool, or
+redelivered after a crash is acked and skipped. A message without a
+ticket id is acked and dropped. One whose claim raises is requeued once
+and rejected if it fails again, so it can't hold the head of the queue;
+its ticket stays Open and `flask dispatch-requeue` queues it again.
+"""
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from notifications import RabbitMQTransport
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE = 'ticket_dispatch'
+MAX_SKIPPED = 50  # stale messages discarded by one next_ticket() call before it gives up
+DEPTHS_RETRY = 30  # seconds depths() waits before trying an unreachable broker again
+
+
+def routing_key(service_type):
+    """ticket.<service>; dots, spaces and wildcards would break topic matching."""
+    if service_type == '*':
+        return 'ticket.*'
+    return 'ticket.' + (re.sub(r'[\s.*#]+', '-', service_type.strip().lower()) or '-')
+
+
+def encode(message):
+    return routing_key(message['service_type']), message['priority'], json.dumps(message)
+
+
+def publish(channel, exchange, encoded, pika):
+    key, priority, body = encoded
+    channel.basic_publish(exchange=exchange, routing_key=key, body=body,
+                          properties=pika.BasicProperties(delivery_mode=2, priority=priority))
+
+
+def ticket_id_of(body):
+    """The ticket id of a dispatch message, or None if it isn't one."""
+    try:
+        ticket_id = json.loads(body)['ticket_id']
+    except (ValueError, KeyError, TypeError):
+        return None
+    return ticket_id if type(ticket_id) is int else None
+
+
+def queue_name(pool):
+    return f'dispatch.{pool}'
+
+
+def declare(channel, exchange, pools, max_priority):
+    channel.exchange_declare(exchange=exchange, exchange_type='topic', durable=True)
+    for pool, services in pools.items():
+        channel.queue_declare(queue=queue_name(pool), durable=True,
+                              arguments={'x-max-priority': max_priority})
+        for service in services:
+            channel.queue_bind(queue=queue_name(pool), exchange=exchange,
+                               routing_key=routing_key(service))
+
+
+class DispatchTransport(RabbitMQTransport):
+    """RabbitMQTransport publishing (routing key, priority, body) to the topic exchange."""
+
+    def __init__(self, host, pools, max_priority, exchange=EXCHANGE, **kwargs):
+        super().__init__(host, queue_name=exchange, **kwargs)
+        self.pools = pools
+        self.max_priority = max_priority
+
+    def _encode(self, event):
+        return encode(event)
+
+    def _declare(self):
+        declare(self.channel, self.queue_name, self.pools, self.max_priority)
+
+    def _basic_publish(self, message):
+        publish(self.channel, self.queue_name, message, self.pika)
+
+
+class Dispatcher:
+
+    def __init__(self, app, priorities, claim):
+        self.priorities = priorities
+        self.claim = claim
+        self.pools = app.config.get('DISPATCH_POOLS') or {}
+        self.host = app.config.get('DISPATCH_RABBITMQ_HOST')
+        self.max_priority = max(priorities.values())
+        self.depths_ttl = app.config.get('DISPATCH_DEPTHS_TTL', 5)
+        self.transport = None
+        self._local = threading.local()
+        self._depths = (None, None)  # (expires_at, depths)
+        self._depths_lock = threading.Lock()
+        if self.enabled:
+            import pika  # optional dependency, only needed for dispatch
+
+            self.pika = pika
+            self.parameters = pika.ConnectionParameters(self.host, heartbeat=60)
+            self.transport = DispatchTransport(self.host, self.pools, self.max_priority)
+            atexit.register(self.transport.close)
+
+    @property
+    def enabled(self):
+        return bool(self.host and self.pools)
+
+    def message(self, ticket):
+        return {'ticket_id': ticket.id, 'service_type': ticket.service_type,
+                'priority': self.priorities.get(ticket.priority, 0)}
+
+    def emit(self, session, ticket):
+        """Publish `ticket` once `session` commits; dropped on rollback. Needs ticket.id."""
+        if self.enabled:
+            session.info.setdefault('dispatch_tickets', []).append((self, self.message(ticket)))
+
+    def close(self, timeout=5):
+        if self.transport is not None:
+            self.transport.close(timeout)
+
+    def requeue(self, tickets):
+        """Publish `tickets` now, on this thread. Returns how many were published."""
+
+        def send(channel):
+            published = 0
+            for ticket in tickets:
+                publish(channel, EXCHANGE, encode(self.message(ticket)), self.pika)
+                published += 1
+            return published
+        return send(self._channel())
+
+    def _channel(self, reconnect=False):
+        channel = getattr(self._local, 'channel', None)
+        if reconnect or channel is None or not channel.is_open:
+            self._disconnect()
+            connection = self.pika.BlockingConnection(self.parameters)
+            channel = connection.channel()
+            declare(channel, EXCHANGE, self.pools, self.max_priority)
+            self._local.connection, self._local.channel = connection, channel
+        return channel
+
+    def _disconnect(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = self._local.channel = None
+        try:
+            if connection is not None and connection.is_open:
+                connection.close()
+        except self.pika.exceptions.AMQPError:
+            pass
+
+    def _with_channel(self, operation):
+        # This thread's connection may have missed heartbeats while idle; retry once on a new one
+        try:
+            return operation(self._channel())
+        except self.pika.exceptions.AMQPConnectionError:
+            return operation(self._channel(reconnect=True))
+
+    def next_ticket(self, pool, engineer_id):
+        """Claim the highest-priority waiting ticket of `pool`. Returns its id or None."""
+
+        def take(channel):
+            for _ in range(MAX_SKIPPED):
+                method, properties, body = channel.basic_get(queue_name(pool), auto_ack=False)
+                if method is None:
+                    return None
+                ticket_id = ticket_id_of(body)
+                if ticket_id is None:
+                    logger.warning('Dropping malformed message from %s: %r', queue_name(pool), body[:200])
+                    channel.basic_ack(delivery_tag=method.delivery_tag)
+                    continue
+                try:
+                    claimed = self.claim(ticket_id, engineer_id)
+                except Exception:
+                    if method.redelivered:
+                        logger.error('Claiming ticket %s failed again, dropping its message', ticket_id)
+                    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+                    raise
+                try:
+                    channel.basic_ack(delivery_tag=method.delivery_tag)
+                except self.pika.exceptions.AMQPConnectionError:
+                    # The message is redelivered and, once claimed, skipped; don't claim another
+                    if claimed:
+                        self._disconnect()
+                        return ticket_id
+                    raise
+                if claimed:
+                    return ticket_id
+            return None
+        return self._with_channel(take)
+
+    def depths(self):
+        """Waiting messages per pool, or None when the broker can't be reached.
+
+        Cached for depths_ttl seconds (DEPTHS_RETRY after a failure), and
+        only one thread refreshes it; the others get the cached value, so
+        dashboards don't wait on the broker.
+        """
+        expires_at, depths = self._depths
+        if expires_at is not None and time.monotonic() < expires_at:
+            return depths
+        if not self._depths_lock.acquire(blocking=False):
+            return depths
+        try:
+            depths = self._read_depths()
+            ttl = self.depths_ttl if depths is not None else DEPTHS_RETRY
+            self._depths = (time.monotonic() + ttl, depths)
+        finally:
+            self._depths_lock.release()
+        return depths
+
+    def _read_depths(self):
+        try:
+            return self._with_channel(lambda channel: {
+                pool: channel.queue_declare(queue=queue_name(pool), passive=True).method.message_count
+                for pool in self.pools})
+        except (self.pika.exceptions.AMQPError, OSError) as e:
+            logger.warning('Dispatch queues unavailable: %s', e)
+            self._disconnect()
+            return None
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for dispatcher, message in session.info.pop('dispatch_tickets', ()):
+        dispatcher.transport.publish(message)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('dispatch_tickets', None)
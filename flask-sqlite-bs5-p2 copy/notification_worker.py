@@ -0,0 +1,17 @@
+"""Writes notifications for ticket events published to RabbitMQ.
+
+Only needed when NOTIFICATION_RABBITMQ_HOST is set; run one or more next
+to the web workers:
+
+    python notification_worker.py
+"""
+import logging
+
+from app import app, db, notifications
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        db.create_all()
+    print('Waiting for ticket events. To exit press CTRL+C')
+    notifications.consume(app.config['NOTIFICATION_RABBITMQ_HOST'] or 'localhost')
@@ -0,0 +1,59 @@
+"""Run with: python -m pytest test_app.py"""
+import os
+
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ['FLASK_TESTING'] = 'true'  # also makes QueryBudget raise instead of log
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db, Ticket, User
+
+
+@pytest.fixture
+def ticket_id():
+    with app.app_context():
+        db.create_all()
+        customer = User(email='customer@example.com', password=generate_password_hash('secret'),
+                        role='customer', name='Customer')
+        engineer = User(email='engineer@example.com', password=generate_password_hash('secret'),
+                        role='engineer', name='Engineer')
+        db.session.add_all([customer, engineer])
+        db.session.flush()
+        ticket = Ticket(title='Mail is down', service_type='Email', description='No mail since morning',
+                        status='Resolved', solution='Restarted the mail server',
+                        customer_id=customer.id, engineer_id=engineer.id)
+        db.session.add(ticket)
+        db.session.commit()
+        ticket_id = ticket.id
+    # Requests get a fresh session; one left open here would answer lazy loads from memory
+    yield ticket_id
+    with app.app_context():
+        db.drop_all()
+
+
+def login(email):
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': 'secret'})
+    return client
+
+
+@pytest.mark.parametrize('email, form_action', [
+    ('customer@example.com', 'confirm'),
+    ('engineer@example.com', 'resolve'),
+])
+def test_view_ticket_renders_within_query_budget(ticket_id, email, form_action):
+    response = login(email).get(f'/ticket/{ticket_id}')
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Customer' in page and 'Engineer' in page
+    assert f'/ticket/{ticket_id}/{form_action}' in page
+
+
+def test_customer_confirms_resolved_ticket(ticket_id):
+    response = login('customer@example.com').post(f'/ticket/{ticket_id}/confirm')
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Ticket, ticket_id).status == 'Confirmed'
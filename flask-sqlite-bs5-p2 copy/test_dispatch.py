@@ -0,0 +1,194 @@
+"""Run with: python -m pytest test_dispatch.py"""
+from types import SimpleNamespace
+
+import pika
+import pytest
+
+import dispatch
+from dispatch import Dispatcher, EXCHANGE, routing_key
+
+PRIORITIES = {'Normal': 0, 'High': 5, 'Urgent': 9}
+POOLS = {'network': ['Email', 'Internet'], 'desk': ['Software', 'Hardware'], 'all': ['*']}
+
+
+class FakeChannel:
+    """Just enough of a pika channel: a topic exchange and priority queues."""
+
+    is_open = True
+
+    def __init__(self):
+        self.bindings = []  # (queue, routing key)
+        self.queues = {}  # queue -> [(priority, order, redelivered, body)]
+        self.unacked = {}  # delivery tag -> (queue, priority, order, body)
+        self.acked, self.rejected = [], []
+        self.passive_declares = 0
+        self._order = 0
+        self._tag = 0
+
+    def exchange_declare(self, exchange, exchange_type, durable):
+        pass
+
+    def queue_declare(self, queue, durable=False, arguments=None, passive=False):
+        if passive:
+            self.passive_declares += 1
+            return SimpleNamespace(method=SimpleNamespace(message_count=len(self.queues.get(queue, []))))
+        self.queues.setdefault(queue, [])
+
+    def queue_bind(self, queue, exchange, routing_key):
+        self.bindings.append((queue, routing_key))
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        for queue, key in self.bindings:
+            if key == routing_key or (key == 'ticket.*' and routing_key.startswith('ticket.')):
+                self._put(queue, properties.priority, False, body)
+
+    def _put(self, queue, priority, redelivered, body, order=None):
+        if order is None:
+            self._order += 1
+            order = self._order
+        self.queues[queue].append((priority, order, redelivered, body))
+        self.queues[queue].sort(key=lambda message: (-message[0], message[1]))
+
+    def basic_get(self, queue, auto_ack):
+        if not self.queues[queue]:
+            return None, None, None
+        priority, order, redelivered, body = self.queues[queue].pop(0)
+        self._tag += 1
+        self.unacked[self._tag] = (queue, priority, order, body)
+        return SimpleNamespace(delivery_tag=self._tag, redelivered=redelivered), None, body
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(self.unacked.pop(delivery_tag)[3])
+
+    def basic_nack(self, delivery_tag, requeue):
+        queue, priority, order, body = self.unacked.pop(delivery_tag)
+        if requeue:
+            self._put(queue, priority, True, body, order)
+        else:
+            self.rejected.append(body)
+
+
+class Claims:
+    """claim(ticket_id, engineer_id) that succeeds once per ticket, like the conditional UPDATE."""
+
+    def __init__(self):
+        self.owners = {}
+        self.failing = set()
+
+    def __call__(self, ticket_id, engineer_id):
+        if ticket_id in self.failing:
+            raise RuntimeError('database is locked')
+        return self.owners.setdefault(ticket_id, engineer_id) == engineer_id
+
+
+@pytest.fixture
+def channel():
+    return FakeChannel()
+
+
+@pytest.fixture
+def claims():
+    return Claims()
+
+
+@pytest.fixture
+def dispatcher(channel, claims):
+    app = SimpleNamespace(config={'DISPATCH_RABBITMQ_HOST': 'localhost', 'DISPATCH_POOLS': POOLS})
+    dispatcher = Dispatcher(app, PRIORITIES, claims)
+    dispatch.declare(channel, EXCHANGE, POOLS, dispatcher.max_priority)
+    dispatcher._channel = lambda reconnect=False: channel
+    return dispatcher
+
+
+def ticket(ticket_id, service_type, priority='Normal'):
+    return SimpleNamespace(id=ticket_id, service_type=service_type, priority=priority)
+
+
+def test_routing_keys():
+    assert routing_key('Email') == 'ticket.email'
+    assert routing_key(' Web Hosting ') == 'ticket.web-hosting'
+    assert routing_key('a.b#c*d') == 'ticket.a-b-c-d'
+    assert routing_key('') == 'ticket.-'
+    assert routing_key('*') == 'ticket.*'
+
+
+def test_ticket_reaches_every_pool_of_its_service(dispatcher, channel):
+    dispatcher.requeue([ticket(1, 'Email'), ticket(2, 'Hardware')])
+
+    assert len(channel.queues['dispatch.network']) == 1
+    assert len(channel.queues['dispatch.desk']) == 1
+    assert len(channel.queues['dispatch.all']) == 2
+
+
+def test_pool_hands_out_urgent_before_high_and_normal(dispatcher):
+    dispatcher.requeue([ticket(1, 'Email'), ticket(2, 'Internet', 'Urgent'),
+                        ticket(3, 'Email', 'High'), ticket(4, 'Email', 'Urgent')])
+
+    taken = [dispatcher.next_ticket('network', engineer_id=7) for _ in range(5)]
+
+    assert taken == [2, 4, 3, 1, None]
+
+
+def test_ticket_claimed_from_another_pool_is_acked_and_skipped(dispatcher, channel):
+    urgent = ticket(1, 'Email', 'Urgent')
+    dispatcher.requeue([urgent, ticket(2, 'Software')])
+
+    assert dispatcher.next_ticket('network', engineer_id=7) == 1
+    # The same ticket waits in the catch-all pool; the second engineer gets the next one
+    assert dispatcher.next_ticket('all', engineer_id=8) == 2
+    assert channel.queues['dispatch.all'] == [] and not channel.unacked
+    assert channel.acked.count(dispatch.encode(dispatcher.message(urgent))[2]) == 2
+
+
+def test_malformed_message_is_dropped(dispatcher, channel):
+    channel.basic_publish(EXCHANGE, 'ticket.email', b'not json', pika.BasicProperties(priority=9))
+    channel.basic_publish(EXCHANGE, 'ticket.email', b'{"id": 1}', pika.BasicProperties(priority=9))
+    dispatcher.requeue([ticket(3, 'Email')])
+
+    assert dispatcher.next_ticket('network', engineer_id=7) == 3
+    assert b'not json' in channel.acked and b'{"id": 1}' in channel.acked
+
+
+def test_failing_claim_is_requeued_once_then_rejected(dispatcher, channel, claims):
+    dispatcher.requeue([ticket(1, 'Email', 'Urgent'), ticket(2, 'Email')])
+    claims.failing.add(1)
+
+    with pytest.raises(RuntimeError):
+        dispatcher.next_ticket('network', engineer_id=7)
+    assert len(channel.queues['dispatch.network']) == 2
+    with pytest.raises(RuntimeError):
+        dispatcher.next_ticket('network', engineer_id=7)
+    assert len(channel.rejected) == 1
+    # No longer stuck at the head of the queue
+    assert dispatcher.next_ticket('network', engineer_id=7) == 2
+
+
+def test_depths_are_cached(dispatcher, channel, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(dispatch.time, 'monotonic', lambda: now[0])
+    dispatcher.requeue([ticket(1, 'Email')])
+
+    assert dispatcher.depths() == {'network': 1, 'desk': 0, 'all': 1}
+    dispatcher.requeue([ticket(2, 'Software')])
+    assert dispatcher.depths()['desk'] == 0
+    assert channel.passive_declares == len(POOLS)
+
+    now[0] += dispatcher.depths_ttl
+    assert dispatcher.depths()['desk'] == 1
+    assert channel.passive_declares == 2 * len(POOLS)
+
+
+def test_unreachable_broker_is_retried_later(dispatcher, channel, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(dispatch.time, 'monotonic', lambda: now[0])
+
+    def unreachable(reconnect=False):
+        raise pika.exceptions.AMQPConnectionError('refused')
+    dispatcher._channel = unreachable
+
+    assert dispatcher.depths() is None
+    dispatcher._channel = lambda reconnect=False: channel
+    now[0] += dispatcher.depths_ttl
+    assert dispatcher.depths() is None
+    now[0] += dispatch.DEPTHS_RETRY
+    assert dispatcher.depths() == {'network': 0, 'desk': 0, 'all': 0}
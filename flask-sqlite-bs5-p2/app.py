@@ -1,17 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+import io
+import math
+import time
+
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import tuple_, func, literal_column
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlite_profile import configure_sqlite, install_profile_pragmas
+from cache import make_cache, invalidate_on_change
+from query_budget import QueryBudget
+from instrumentation import Instrumentation
+from login_protection import LoginProtection, HashingBusy
+from notifications import NotificationPipeline
+from notification_stream import NotificationHub, stream
+import archive
+import bulk
+import schema
+import search
+import stats
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+app.config['SQLITE_PROFILE'] = 'performance'  # default, durable, performance
+app.config['USER_CACHE_TTL'] = 60
+app.config['USER_CACHE_SIZE'] = 10000
+# একই হোস্টের ওয়ার্কাররা এই ফোল্ডারের ফাইল দিয়ে একে অপরের ক্যাশ বাতিল করে; None = instance/
+app.config['CACHE_SHARED_DIR'] = None
+app.config['NOTIFICATION_RABBITMQ_HOST'] = None  # None = অ্যাপের ভেতরেই ব্যাকগ্রাউন্ড থ্রেড
+app.config['NOTIFICATION_STREAM_RECHECK'] = 15  # সেকেন্ড
+# প্রতি প্রসেসে একসাথে খোলা স্ট্রিম (প্রতিটি একটি থ্রেড ধরে রাখে); বাকিরা পোল করে; None = সীমা নেই
+app.config['NOTIFICATION_STREAM_LIMIT'] = None
+# (চেষ্টা, সেকেন্ড): প্রতি IP ও প্রতি ইমেইলে এতবার, তারপর অপেক্ষা; {} = সীমা নেই
+app.config['LOGIN_RATE_LIMITS'] = {'ip': (20, 60), 'email': (5, 300)}
+app.config['REGISTER_RATE_LIMITS'] = {'ip': (5, 3600)}
+app.config['PASSWORD_HASH_WORKERS'] = 1  # পাসওয়ার্ড হ্যাশ এর বেশি থ্রেডে একসাথে চলে না
+# WORKERS = 0 হলে সব প্রসেস মিলে এতগুলো হ্যাশ একসাথে চলে (লক ফাইল দিয়ে); gunicorn.conf.py দুটোই ঠিক করে
+app.config['PASSWORD_HASH_CPUS'] = 1
+app.config['ARCHIVE_DATABASE'] = None  # None = database.db-এর পাশে database-archive.db
+app.config['ARCHIVE_AFTER_DAYS'] = 90
+app.config['METRICS_PROFILE_ENDPOINTS'] = []  # যেমন ['dashboard']; এই রাউটগুলোর স্ট্যাক স্যাম্পল হয়
+# FLASK_ দিয়ে শুরু এনভায়রনমেন্ট ভেরিয়েবল কনফিগ বদলায়, যেমন FLASK_SQLALCHEMY_DATABASE_URI
+app.config.from_prefixed_env()
+configure_sqlite(app)
 db = SQLAlchemy(app)
+install_profile_pragmas(app, db)
+query_budget = QueryBudget(app)
+# রাউট, SQL আর RabbitMQ পাবলিশের লেটেন্সি /metrics-এ; শুধু অ্যাডমিন বা FLASK_METRICS_TOKEN দিয়ে
+instrumentation = Instrumentation(app, authorize=lambda: current_user.is_authenticated
+                                  and current_user.role == 'admin')
+# লগইন/রেজিস্টারের থ্রটলিং; হ্যাশ আলাদা সীমিত থ্রেড পুলে হয়
+login_protection = LoginProtection(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# সব সময়ের মান naive UTC; SQLite-এ একই ফরম্যাটে (মাইক্রোসেকেন্ডসহ) থাকে, তাই কার্সরের তুলনা ঠিক থাকে
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # ডেটাবেস মডেল
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -19,6 +71,8 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(100))
     role = db.Column(db.String(20))  # customer, engineer, admin
     name = db.Column(db.String(100))
+    # অপঠিত নোটিফিকেশনের সংখ্যা, নোটিফিকেশনের সাথে একই ট্রানজেকশনে আপডেট হয়
+    unread_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     notifications = db.relationship('Notification', backref='user', lazy=True)
 
 class Notification(db.Model):
@@ -26,11 +80,22 @@ class Notification(db.Model):
     content = db.Column(db.String(200))
     is_read = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+    __table_args__ = (
+        # প্রোফাইল ও স্ট্রিমের জন্য; আংশিক ইনডেক্সে শুধু অপঠিতগুলো থাকে
+        db.Index('ix_notification_user', 'user_id', 'id'),
+        db.Index('ix_notification_unread', 'user_id', 'id', sqlite_where=db.text('is_read = 0')),
+        # আর্কাইভ জবের জন্য, শুধু পঠিতগুলো
+        db.Index('ix_notification_read_created', 'created_at', sqlite_where=db.text('is_read = 1')),
+    )
 
 class Service(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50))
 
+TICKET_STATUSES = ['Open', 'In Progress', 'Resolved', 'Confirmed']
+
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100))
@@ -40,21 +105,155 @@ class Ticket(db.Model):
     solution = db.Column(db.String(500))
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     engineer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    created_at = db.Column(db.DateTime, default=utcnow)
+    customer = db.relationship('User', foreign_keys=[customer_id])
+    engineer = db.relationship('User', foreign_keys=[engineer_id])
+
+    # ড্যাশবোর্ডের keyset পেজিনেশনের জন্য কম্পোজিট ইনডেক্স
+    __table_args__ = (
+        db.Index('ix_ticket_customer_created', 'customer_id', 'created_at'),
+        db.Index('ix_ticket_engineer_created', 'engineer_id', 'created_at'),
+        db.Index('ix_ticket_status_created', 'status', 'created_at'),
+        db.Index('ix_ticket_created', 'created_at'),
+    )
+
+# টিকেট টেবিলের সাথে FTS5 সার্চ ইনডেক্স ও ট্রিগার তৈরি হয়
+search.install(Ticket.__table__)
+# স্ট্যাটাস/সার্ভিস/ইঞ্জিনিয়ার/দিন অনুযায়ী টিকেটের সংখ্যা ট্রিগার দিয়ে রোলআপ টেবিলে থাকে
+stats.install(Ticket.__table__)
+
+# পুরনো Confirmed টিকেট আর পঠিত নোটিফিকেশন আলাদা আর্কাইভ ডেটাবেসে সরে যায় (flask archive);
+# আর্কাইভ প্রতিটি কানেকশনে ATTACH করা থাকে, তাই একই সেশন থেকে পড়া যায়
+archive.install(app, db)
+
+class ArchivedTicket(db.Model):
+    __table__ = archive.archive_table(Ticket.__table__, db.metadata)
+    customer = db.relationship('User', primaryjoin='foreign(ArchivedTicket.customer_id) == User.id',
+                               viewonly=True)
+    engineer = db.relationship('User', primaryjoin='foreign(ArchivedTicket.engineer_id) == User.id',
+                               viewonly=True)
+
+archived_notifications = archive.archive_table(Notification.__table__, db.metadata)
+
+# সার্ভিস লিস্ট প্রায় বদলায় না, তাই ক্যাশ থেকে ড্রপডাউন ভরা হয়
+cache = make_cache(app)
+SERVICES_CACHE_KEY = 'services'
+invalidate_on_change(Service, cache, SERVICES_CACHE_KEY)
+
+def get_services():
+    services = cache.get(SERVICES_CACHE_KEY)
+    if services is None:
+        services = [{'id': service.id, 'name': service.name}
+                    for service in Service.query.order_by(Service.id)]
+        cache.set(SERVICES_CACHE_KEY, services)
+    return services
+
+# লগইন করা ইউজারের পরিচয় ক্যাশ থেকে, প্রতি রিকোয়েস্টে ডেটাবেসে যেতে হয় না
+USER_CACHE_FIELDS = ('id', 'email', 'role', 'name')
+user_cache = make_cache(app, ttl=app.config['USER_CACHE_TTL'],
+                        maxsize=app.config['USER_CACHE_SIZE'], prefix='ticketing:user:')
+invalidate_on_change(User, user_cache, lambda user: str(user.id))
+
+# টিকেট ইভেন্ট থেকে কে কোন নোটিফিকেশন পাবে
+def notification_recipients(event):
+    ticket_id = event['ticket_id']
+    if event['type'] == 'resolved':
+        return [(event['customer_id'], f'Your ticket #{ticket_id} has been resolved')]
+    if event['type'] == 'confirmed':
+        return [(event['engineer_id'], f'Ticket #{ticket_id} has been confirmed by the customer')]
+    return []
+
+notifications = NotificationPipeline(app, db, Notification, notification_recipients,
+                                     unread_counter=User.unread_count)
+# নতুন নোটিফিকেশন খোলা SSE স্ট্রিমে পুশ করা হয়
+notification_hub = NotificationHub(max_streams=app.config['NOTIFICATION_STREAM_LIMIT'])
+notifications.add_deliverer(notification_hub.publish)
+
+@app.context_processor
+def inject_navbar_urls():
+    return {'notification_stream_url': url_for('notification_stream'),
+            'search_url': url_for('search_tickets')}
+
+def emit_ticket_event(event_type, ticket):
+    notifications.emit(db.session, {
+        'type': event_type,
+        'ticket_id': ticket.id,
+        'customer_id': ticket.customer_id,
+        'engineer_id': ticket.engineer_id,
+    })
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    data = user_cache.get(user_id)
+    if data is None:
+        user = db.session.get(User, int(user_id))
+        if user is not None:
+            user_cache.set(user_id, {field: getattr(user, field) for field in USER_CACHE_FIELDS})
+        return user
+    # কোয়েরি ছাড়াই সেশনে যোগ করা হয়; পাসওয়ার্ডের মতো বাকি কলাম দরকার হলে তখন লোড হয়
+    user = User(**data)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+# পেজিনেশন হেল্পার
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def parse_cursor(cursor):
+    # কার্সর ফরম্যাট: <created_at ISO>_<id>
+    try:
+        created_at, ticket_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(ticket_id)
+    except (AttributeError, ValueError):
+        return None
+
+def make_cursor(ticket):
+    return f'{ticket.created_at.isoformat()}_{ticket.id}'
+
+def get_page_size():
+    page_size = request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def paginate_tickets(query, cursor, page_size):
+    # created_at, id অনুযায়ী নতুন থেকে পুরাতন; OFFSET ছাড়াই পরের পেজ
+    query = query.order_by(Ticket.created_at.desc(), Ticket.id.desc())
+    position = parse_cursor(cursor) if cursor else None
+    if position:
+        query = query.filter(tuple_(Ticket.created_at, Ticket.id) < position)
+    rows = query.limit(page_size + 1).all()
+    tickets = rows[:page_size]
+    next_cursor = make_cursor(tickets[-1]) if len(rows) > page_size else None
+    return tickets, next_cursor
 
 # অথেন্টিকেশন রাউটস
+def auth_refused(template, status, retry_after, message):
+    # 429 = এই IP/ইমেইল থেকে বেশি চেষ্টা, 503 = হ্যাশ পুল ভর্তি
+    flash(message)
+    response = make_response(render_template(template), status)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
+        # হ্যাশ করার আগেই থ্রটল, যাতে অতিরিক্ত চেষ্টায় CPU খরচ না হয়
+        retry_after = login_protection.throttle('login', ip=request.remote_addr, email=email.strip().lower())
+        if retry_after:
+            return auth_refused('auth/login.html', 429, retry_after, 'Too many login attempts, try again later!')
         user = User.query.filter_by(email=email).first()
         
-        if user and check_password_hash(user.password, password):
+        try:
+            valid, new_hash = login_protection.hasher.verify(user.password, password) if user else (False, None)
+        except HashingBusy:
+            app.logger.warning('Password hashing pool full, refusing login')
+            return auth_refused('auth/login.html', 503, 1, 'Server is busy, try again shortly!')
+        if valid:
+            if new_hash:
+                # হ্যাশের কস্ট বদলালে সঠিক পাসওয়ার্ড দিয়ে লগইনের সময় নতুন হ্যাশ
+                user.password = new_hash
+                db.session.commit()
             login_user(user)
             return redirect(url_for('dashboard'))
         flash('Invalid credentials!')
@@ -64,14 +263,21 @@ def login():
 def register():
     if request.method == 'POST':
         email = request.form['email']
-        password = generate_password_hash(request.form['password'])
         name = request.form['name']
         role = request.form['role']
+        retry_after = login_protection.throttle('register', ip=request.remote_addr)
+        if retry_after:
+            return auth_refused('auth/register.html', 429, retry_after, 'Too many registrations, try again later!')
         
         if User.query.filter_by(email=email).first():
             flash('Email already exists!')
             return redirect(url_for('register'))
         
+        try:
+            password = login_protection.hasher.generate(request.form['password'])
+        except HashingBusy:
+            app.logger.warning('Password hashing pool full, refusing registration')
+            return auth_refused('auth/register.html', 503, 1, 'Server is busy, try again shortly!')
         new_user = User(email=email, password=password, name=name, role=role)
         db.session.add(new_user)
         db.session.commit()
@@ -87,17 +293,81 @@ def logout():
 # ড্যাশবোর্ড রাউটস
 @app.route('/dashboard')
 @login_required
+@query_budget.limit(3)
 def dashboard():
+    cursor = request.args.get('cursor')
+    page_size = get_page_size()
+    status = request.args.get('status')
+    status_counts = {}
     if current_user.role == 'customer':
-        tickets = Ticket.query.filter_by(customer_id=current_user.id).all()
-        return render_template('customer_dashboard.html', tickets=tickets)
+        query = Ticket.query.filter_by(customer_id=current_user.id)
+        template = 'customer_dashboard.html'
     elif current_user.role == 'engineer':
-        tickets = Ticket.query.filter_by(engineer_id=current_user.id).all()
-        return render_template('engineer_dashboard.html', tickets=tickets)
+        query = Ticket.query.filter_by(engineer_id=current_user.id)
+        template = 'engineer_dashboard.html'
     elif current_user.role == 'admin':
-        tickets = Ticket.query.all()
-        return render_template('admin_dashboard.html', tickets=tickets)
-    return redirect(url_for('login'))
+        query = Ticket.query
+        if status:
+            query = query.filter_by(status=status)
+        # ফিল্টার বাটনের সংখ্যা রোলআপ থেকে, টিকেট গোনা হয় না
+        status_counts = stats.status_counts(db.session)
+        template = 'admin_dashboard.html'
+    else:
+        return redirect(url_for('login'))
+    # কাস্টমার/ইঞ্জিনিয়ারের নাম একই কোয়েরিতে JOIN করে আনা হয়, প্রতি সারিতে আলাদা কোয়েরি নয়
+    query = query.options(joinedload(Ticket.customer), joinedload(Ticket.engineer))
+    tickets, next_cursor = paginate_tickets(query, cursor, page_size)
+    filters = {'status': status} if status else {}
+    return render_template(template, tickets=tickets, next_cursor=next_cursor,
+                           cursor=cursor, page_size=page_size, status=status, filters=filters,
+                           status_counts=status_counts)
+
+# অ্যাডমিন অ্যানালিটিক্স; শুধু রোলআপ টেবিল পড়ে, টিকেটের সংখ্যা যত বাড়ুক খরচ একই থাকে
+# আর্কাইভে সরানো টিকেট রোলআপ থেকেও বাদ যায়, তাই পেজে শুধু সক্রিয় টিকেট
+ANALYTICS_DAYS = 30
+
+@app.route('/analytics')
+@login_required
+@query_budget.limit(3)
+def analytics():
+    if current_user.role != 'admin':
+        return redirect(url_for('dashboard'))
+    summary = stats.summary(db.session, days=ANALYTICS_DAYS)
+    engineer_ids = [int(key) for key in summary['engineer'] if key]
+    engineers = dict(db.session.query(User.id, User.name).filter(User.id.in_(engineer_ids))) if engineer_ids else {}
+    return render_template('analytics.html', summary=summary, engineers=engineers,
+                           statuses=TICKET_STATUSES, days=ANALYTICS_DAYS,
+                           archive_days=app.config['ARCHIVE_AFTER_DAYS'])
+
+# ফুল-টেক্সট সার্চ; কাস্টমার শুধু নিজের টিকেটে খোঁজে
+def run_search():
+    search_text = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    page_size = get_page_size()
+    customer_id = current_user.id if current_user.role == 'customer' else None
+    hits, next_cursor = search.search(db.session, search_text, customer_id, cursor, page_size)
+    tickets = {ticket.id: ticket for ticket in Ticket.query.options(joinedload(Ticket.customer))
+               .filter(Ticket.id.in_([hit.id for hit in hits]))} if hits else {}
+    results = [(tickets[hit.id], hit.snippet) for hit in hits if hit.id in tickets]
+    return search_text, results, cursor, next_cursor, page_size
+
+@app.route('/search')
+@login_required
+@query_budget.limit(4)
+def search_tickets():
+    search_text, results, cursor, next_cursor, page_size = run_search()
+    return render_template('search.html', q=search_text, results=results, cursor=cursor,
+                           next_cursor=next_cursor, page_size=page_size, filters={'q': search_text})
+
+@app.route('/api/search')
+@login_required
+@query_budget.limit(4)
+def search_api():
+    search_text, results, cursor, next_cursor, page_size = run_search()
+    return jsonify(results=[{'id': ticket.id, 'title': ticket.title, 'status': ticket.status,
+                             'service_type': ticket.service_type, 'snippet': snippet}
+                            for ticket, snippet in results],
+                   next_cursor=next_cursor)
 
 # টিকেট ম্যানেজমেন্ট রাউটস
 @app.route('/create_ticket', methods=['GET', 'POST'])
@@ -123,16 +393,25 @@ def create_ticket():
         db.session.commit()
         return redirect(url_for('dashboard'))
     
-    services = Service.query.all()
+    services = get_services()
     return render_template('create_ticket.html', services=services)
 
 @app.route('/ticket/<int:ticket_id>')
 @login_required
+@query_budget.limit(3)
 def view_ticket(ticket_id):
-    ticket = Ticket.query.get(ticket_id)
+    ticket = db.session.get(Ticket, ticket_id,
+                            options=[joinedload(Ticket.customer), joinedload(Ticket.engineer)])
+    archived = False
+    if ticket is None:
+        # সক্রিয় টেবিলে না থাকলে আর্কাইভে খোঁজা হয়
+        ticket = db.session.get(ArchivedTicket, ticket_id,
+                                options=[joinedload(ArchivedTicket.customer),
+                                         joinedload(ArchivedTicket.engineer)])
+        archived = ticket is not None
     if not ticket or (current_user.role == 'customer' and ticket.customer_id != current_user.id):
         return redirect(url_for('dashboard'))
-    return render_template('ticket.html', ticket=ticket)
+    return render_template('ticket.html', ticket=ticket, archived=archived)
 
 @app.route('/edit_ticket/<int:ticket_id>', methods=['GET', 'POST'])
 @login_required
@@ -147,7 +426,7 @@ def edit_ticket(ticket_id):
         db.session.commit()
         return redirect(url_for('view_ticket', ticket_id=ticket_id))
     
-    services = Service.query.all()
+    services = get_services()
     return render_template('edit_ticket.html', ticket=ticket, services=services)
 
 @app.route('/update_ticket/<int:ticket_id>', methods=['POST'])
@@ -158,23 +437,28 @@ def update_ticket(ticket_id):
         ticket.solution = request.form['solution']
         ticket.status = 'Resolved'
         
-        # নোটিফিকেশন তৈরি করুন
-        notification = Notification(
-            content=f'Your ticket #{ticket_id} has been resolved',
-            user_id=ticket.customer_id
-        )
-        db.session.add(notification)
+        # কমিটের পর নোটিফিকেশন ব্যাকগ্রাউন্ডে তৈরি হয়
+        emit_ticket_event('resolved', ticket)
         db.session.commit()
     
     elif current_user.role == 'customer' and ticket.status == 'Resolved':
         ticket.status = 'Confirmed'
+        emit_ticket_event('confirmed', ticket)
         db.session.commit()
     
     return redirect(url_for('view_ticket', ticket_id=ticket_id))
 
+@app.route('/cache/stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'admin':
+        return redirect(url_for('dashboard'))
+    return jsonify(users=user_cache.stats(), services=cache.stats())
+
 # প্রোফাইল এবং নোটিফিকেশন
 @app.route('/profile')
 @login_required
+@query_budget.limit(2)
 def profile():
     notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.id.desc()).all()
     return render_template('profile.html', notifications=notifications)
@@ -182,19 +466,180 @@ def profile():
 @app.route('/mark_notification/<int:notification_id>')
 @login_required
 def mark_notification(notification_id):
-    notification = Notification.query.get(notification_id)
-    if notification and notification.user_id == current_user.id:
-        notification.is_read = True
+    # শুধু অপঠিত থাকলেই কাউন্টার কমে
+    marked = Notification.query.filter_by(id=notification_id, user_id=current_user.id, is_read=False) \
+        .update({'is_read': True}, synchronize_session=False)
+    if marked:
+        User.query.filter_by(id=current_user.id) \
+            .update({'unread_count': User.unread_count - marked}, synchronize_session=False)
         db.session.commit()
+        notification_hub.read_changed(current_user.id)
     return redirect(url_for('profile'))
 
-if __name__ == '__main__':
+@app.route('/notifications/mark_all_read', methods=['POST'])
+@login_required
+def mark_all_notifications():
+    # সব অপঠিত একটি UPDATE-এ
+    marked = Notification.query.filter_by(user_id=current_user.id, is_read=False) \
+        .update({'is_read': True}, synchronize_session=False)
+    if marked:
+        User.query.filter_by(id=current_user.id).update({'unread_count': 0}, synchronize_session=False)
+        db.session.commit()
+        notification_hub.read_changed(current_user.id)
+    return redirect(url_for('profile'))
+
+def notifications_since(user_id, last_id):
+    rows = (db.session.query(Notification.id, Notification.user_id, Notification.content)
+            .filter(Notification.user_id == user_id, Notification.id > last_id)
+            .order_by(Notification.id).limit(100).all())
+    # দীর্ঘ স্ট্রিম যেন পুলের কানেকশন ধরে না রাখে
+    db.session.close()
+    return [dict(row._mapping) for row in rows]
+
+def count_unread(user_id):
+    count = db.session.query(User.unread_count).filter_by(id=user_id).scalar() or 0
+    db.session.close()
+    return count
+
+@app.route('/notifications/stream')
+@login_required
+def notification_stream():
+    # ব্রাউজার রিকানেক্ট করলে Last-Event-ID পাঠায়; না থাকলে শুধু এখন থেকে নতুনগুলো
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    if last_id is None:
+        last_id = db.session.query(func.max(Notification.id)).filter_by(user_id=current_user.id).scalar() or 0
+    messages = stream(notification_hub, current_user.id, last_id, notifications_since, count_unread,
+                      recheck_interval=app.config['NOTIFICATION_STREAM_RECHECK'])
+    return Response(stream_with_context(messages), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# বাল্ক ইমপোর্ট/এক্সপোর্ট (CSV বা JSONL)
+BULK_MODELS = {'tickets': Ticket, 'users': User}
+
+def forget_imported(kind):
+    # বাল্ক ইনসার্ট ORM ইভেন্ট চালায় না, তাই ইউজার ক্যাশ এখানে খালি করা হয়
+    if kind == 'users':
+        user_cache.clear()
+
+def bulk_format(filename=None):
+    # HTTP-তে ?format=, CLI-তে ফাইলের এক্সটেনশন দেখে
+    if filename is None:
+        fmt = request.args.get('format', 'csv')
+    else:
+        fmt = 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+    return fmt if fmt in bulk.FORMATS else 'csv'
+
+@app.route('/export/<any(tickets, users):kind>')
+@login_required
+def export_table(kind):
+    if current_user.role != 'admin':
+        abort(403)
+    fmt = bulk_format()
+    model = BULK_MODELS[kind]
+    lines = bulk.encode(bulk.export_rows(db, model), bulk.columns_of(model), fmt)
+    return Response(stream_with_context(lines), mimetype=bulk.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
+@app.route('/import/<any(tickets, users):kind>', methods=['POST'])
+@login_required
+def import_table(kind):
+    if current_user.role != 'admin':
+        abort(403)
+    # রিকোয়েস্ট বডি লাইন ধরে পড়া হয়, পুরো ফাইল মেমরিতে আসে না
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    started = time.perf_counter()
+    try:
+        imported = bulk.import_rows(db, BULK_MODELS[kind], bulk.parse(lines, bulk_format()))
+    except (ValueError, SQLAlchemyError) as e:
+        return jsonify(error=str(e).splitlines()[0]), 400
+    forget_imported(kind)
+    return jsonify(imported=imported, seconds=round(time.perf_counter() - started, 3))
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Create the ticket search index if needed and rebuild it from the ticket table."""
+    started = time.perf_counter()
+    search.rebuild(db.session)
+    click.echo(f'Search index rebuilt in {time.perf_counter() - started:.2f}s')
+
+@app.cli.command('stats-rebuild')
+def stats_rebuild_command():
+    """Create the ticket statistics table if needed and recount it from the ticket table."""
+    started = time.perf_counter()
+    stats.rebuild(db.session)
+    click.echo(f'Ticket statistics rebuilt in {time.perf_counter() - started:.2f}s')
+
+@app.cli.command('archive')
+@click.option('--days', type=int, help='archive rows older than this (default: ARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', default=archive.BATCH_SIZE, show_default=True)
+@click.option('--every', type=float, help='keep running, archiving every this many seconds')
+def archive_command(days, batch_size, every):
+    """Move old Confirmed tickets and read notifications to the archive database."""
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    while True:
+        started = time.perf_counter()
+        cutoff = utcnow() - timedelta(days=days)
+        tickets = archive.move(db.session, Ticket.__table__, ArchivedTicket.__table__,
+                               (Ticket.status == 'Confirmed') & (Ticket.created_at < cutoff),
+                               Ticket.created_at, batch_size)
+        # আক্ষরিক 1, যাতে আংশিক ইনডেক্স ব্যবহার হয়; created_at ছাড়া পুরনো সারিও সরে
+        read = Notification.is_read == literal_column('1')
+        notifications = archive.move(db.session, Notification.__table__, archived_notifications,
+                                     read & (Notification.created_at.is_(None) | (Notification.created_at < cutoff)),
+                                     Notification.created_at, batch_size)
+        click.echo(f'Archived {tickets} tickets and {notifications} notifications '
+                   f'in {time.perf_counter() - started:.2f}s')
+        if not every:
+            break
+        time.sleep(every)
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--with-passwords', is_flag=True, help='include password hashes')
+def export_command(kind, output, with_passwords):
+    """Write all tickets or users as CSV or JSONL (by file extension)."""
+    model = BULK_MODELS[kind]
+    for line in bulk.encode(bulk.export_rows(db, model), bulk.columns_of(model, with_passwords),
+                            bulk_format(output.name)):
+        output.write(line)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--with-passwords', is_flag=True, help='accept a password hash column')
+def import_command(kind, source, with_passwords):
+    """Load tickets or users from a CSV or JSONL file."""
+    started = time.perf_counter()
+    imported = bulk.import_rows(db, BULK_MODELS[kind], bulk.parse(source, bulk_format(source.name)),
+                                secrets=with_passwords)
+    forget_imported(kind)
+    click.echo(f'Imported {imported} {kind} in {time.perf_counter() - started:.2f}s')
+
+# পুরনো ডেটাবেসে পরে যোগ হওয়া কলামগুলো কী দিয়ে ভরা হবে
+SCHEMA_BACKFILLS = {
+    'user.unread_count': db.text('UPDATE user SET unread_count = (SELECT count(*) FROM notification '
+                                 'WHERE notification.user_id = user.id AND notification.is_read = 0)'),
+}
+
+def init_db():
     with app.app_context():
         db.create_all()
+        # create_all পুরনো টেবিল বদলায় না; নতুন কলাম আর ইনডেক্স এখানে যোগ হয়
+        added = schema.upgrade(db.session, db.metadata, SCHEMA_BACKFILLS,
+                               [(search.FTS_TABLE, search.rebuild), (stats.STATS_TABLE, stats.rebuild)])
+        if added:
+            app.logger.info('Database upgraded: %s', ', '.join(added))
         # ডেমো সার্ভিস যোগ করুন
         if not Service.query.first():
             services = ['মেইল', 'ইন্টারনেট', 'সফটওয়্যার', 'অটোমেশন']
             for service in services:
                 db.session.add(Service(name=service))
             db.session.commit()
-        app.run(debug=True)
\ No newline at end of file
+
+# ডেভেলপমেন্ট সার্ভার; প্রোডাকশনে wsgi.py (gunicorn -c gunicorn.conf.py wsgi:app)
+if __name__ == '__main__':
+    init_db()
+    app.run(debug=True)
\ No newline at end of file
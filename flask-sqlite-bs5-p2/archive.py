@@ -0,0 +1,106 @@
+"""Moves finished tickets and read notifications into an archive database.
+
+The archive is a second SQLite file ATTACHed to every connection as the
+`archive` schema: ARCHIVE_DATABASE, by default <database>-archive.db next
+to the main file. It holds copies of the archived tables made with
+archive_table(): the same columns, without foreign keys, triggers or
+secondary indexes. Each batch is first copied with INSERT ... SELECT and
+committed, then deleted from the main file in a second transaction, so
+the hot tables and their indexes only hold live rows however much history
+is kept. Pages freed by the DELETE are reused by new rows, so the main
+file stops growing too.
+
+    flask archive                  # once, e.g. from cron
+    flask archive --every 3600     # or keep running next to the app
+
+Copy and delete are separate transactions because a transaction over two
+files is only atomic in rollback journal mode; in WAL mode a crash can
+commit one file and not the other. Each transaction here writes a single
+file, and rows are only deleted once their copies are committed and
+counted, so a crash leaves at worst a batch copied but not yet deleted.
+The copy is INSERT OR REPLACE, so the next run copies those rows again as
+they are by then and deletes them. The newest row of a table is never
+moved, because SQLite would give its id to the next insert and the
+archive would then hold a different row with the same id.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import Column, Table, event, func, select
+
+from sqlite_profile import PROFILES
+
+SCHEMA = 'archive'
+BATCH_SIZE = 500
+
+
+def archive_table(table, metadata):
+    """Copy of `table` in the archive schema."""
+    columns = [Column(column.name, column.type, primary_key=column.primary_key)
+               for column in table.columns]
+    return Table(table.name, metadata, *columns, schema=SCHEMA)
+
+
+def archive_path(app, engine):
+    path = app.config.get('ARCHIVE_DATABASE')
+    if path:
+        return path
+    database = engine.url.database
+    if not database or database == ':memory:':
+        return ':memory:'
+    root, extension = os.path.splitext(database)
+    return f'{root}-archive{extension or ".db"}'
+
+
+def install(app, db):
+    """ATTACH the archive to every new connection of the app's engine. Returns its path."""
+    with app.app_context():
+        engine = db.engine
+    path = archive_path(app, engine)
+    # The journal mode belongs to each database file, so the archive needs its own
+    journal_mode = PROFILES[app.config['SQLITE_PROFILE']]['pragmas'].get('journal_mode')
+
+    @event.listens_for(engine, 'connect')
+    def attach_archive(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (path,))
+        if journal_mode and path != ':memory:':
+            cursor.execute(f'PRAGMA {SCHEMA}.journal_mode={journal_mode}')
+        cursor.close()
+    return path
+
+
+def move(session, table, archived, condition, order_by=None, batch_size=BATCH_SIZE):
+    """Move rows of `table` matching `condition` into `archived`. Returns how many moved.
+
+    Each batch is copied and deleted in two short transactions, so
+    writers are only ever blocked for one batch. `order_by` should be the
+    column of the index that serves `condition`, so each batch is read
+    straight from that index.
+    """
+    ids = table.c.id
+    newest = select(func.max(ids)).scalar_subquery()
+    names = [column.name for column in table.columns]
+    moved = 0
+    while True:
+        query = select(ids).where(condition, ids < newest).limit(batch_size)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        batch = session.execute(query).scalars().all()
+        if not batch:
+            return moved
+        session.execute(archived.insert().prefix_with('OR REPLACE').from_select(
+            names, select(*table.columns).where(ids.in_(batch))))
+        session.commit()
+        copied = session.execute(
+            select(func.count()).select_from(archived).where(archived.c.id.in_(batch))).scalar()
+        if copied != len(batch):
+            session.rollback()
+            raise RuntimeError(f'{table.name}: {copied} of {len(batch)} rows reached the archive')
+        # A row changed since the copy may no longer match; it stays, and its
+        # copy is replaced if it is archived later
+        deleted = session.execute(table.delete().where(ids.in_(batch), condition)).rowcount
+        session.commit()
+        moved += deleted
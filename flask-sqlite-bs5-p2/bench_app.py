@@ -0,0 +1,334 @@
+"""Request benchmarks for app.py on seeded data, written as JSON.
+
+    python bench_app.py --scale 10k --output run.json
+    python bench_app.py --database /tmp/bench-1m.db --server --concurrency 4
+    python bench_app.py --scale 100k --baseline run.json
+
+Scenarios run in a fixed order, each sending --requests requests after
+--warmup unrecorded ones. By default they go through Flask's test client;
+with --server they go over HTTP to a local threaded WSGI server. Without
+--database a fresh database is generated at --scale with bench_data.py;
+a given database is copied first, so it is never changed.
+
+The JSON holds the environment (commit, Python, SQLite, scale, seed) and,
+per scenario, throughput, latency percentiles and the mean X-Query-Count.
+--baseline prints the change against an earlier run's JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+import bench_data
+
+WARMUP = 10
+SEARCH_WORDS = ['মেইল', 'vpn', 'printer', 'timeout', 'password reset', 'ইন্টারনেট ধীর']
+
+
+class TestClient:
+
+    def __init__(self, app, base_url=None):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get('X-Query-Count')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect is the response being measured, not a second request to follow
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+
+    def __init__(self, app, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, body, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('X-Query-Count')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('X-Query-Count')
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class Workload:
+    """Logged-in clients and the rows each scenario works through.
+
+    Worker i always uses clients[role][i], so a client is never shared
+    between threads.
+    """
+
+    def __init__(self, models, make_client, concurrency, per_worker, rng):
+        self.models = models
+        self.db = models.db
+        self.rng = rng
+        self.per_worker = per_worker
+        self.anonymous = [make_client() for _ in range(concurrency)]
+        self.users = {}
+        self.clients = {}
+        with models.app.app_context():
+            for role in ('customer', 'engineer', 'admin'):
+                users = self.db.session.execute(
+                    text('SELECT id, email FROM user WHERE role = :role ORDER BY id LIMIT :n'),
+                    {'role': role, 'n': concurrency}).all()
+                if not users:
+                    raise SystemExit(f'the database has no {role} users')
+                # With fewer users than workers some users get several sessions
+                self.users[role] = [users[worker % len(users)] for worker in range(concurrency)]
+            self.emails = self.db.session.execute(
+                text("SELECT email FROM user WHERE role = 'customer' ORDER BY id LIMIT 1000")).scalars().all()
+            self.resolvable = self._assign_in_progress()
+            self.unread = self._add_unread()
+        for role, users in self.users.items():
+            self.clients[role] = []
+            for user in users:
+                client = make_client()
+                status, _ = client.request('POST', '/login',
+                                           {'email': user.email, 'password': bench_data.BENCH_PASSWORD})
+                if status != 302:
+                    raise SystemExit(f'could not log in {user.email} ({status})')
+                self.clients[role].append(client)
+
+    def _assign_in_progress(self):
+        # Hand each benchmark engineer enough In Progress tickets to resolve
+        per_engineer = []
+        for engineer_id, _ in self.users['engineer']:
+            ids = [row.id for row in self.db.session.execute(
+                text("SELECT id FROM ticket WHERE status = 'In Progress' AND id NOT IN "
+                     "(SELECT value FROM json_each(:taken)) ORDER BY id LIMIT :n"),
+                {'taken': json.dumps([i for ids in per_engineer for i in ids]), 'n': self.per_worker})]
+            self.db.session.execute(text('UPDATE ticket SET engineer_id = :engineer_id WHERE id IN '
+                                         '(SELECT value FROM json_each(:ids))'),
+                                    {'engineer_id': engineer_id, 'ids': json.dumps(ids)})
+            per_engineer.append(ids)
+        self.db.session.commit()
+        return per_engineer
+
+    def _add_unread(self):
+        # Fresh unread notifications for each benchmark customer to mark read
+        table = self.models.Notification.__table__
+        per_customer = []
+        for customer_id, _ in self.users['customer']:
+            result = self.db.session.execute(
+                table.insert().returning(table.c.id),
+                [{'user_id': customer_id, 'content': 'benchmark', 'is_read': False}] * self.per_worker)
+            per_customer.append([row.id for row in result])
+            self.db.session.execute(text('UPDATE user SET unread_count = unread_count + :n WHERE id = :id'),
+                                    {'n': self.per_worker, 'id': customer_id})
+        self.db.session.commit()
+        return per_customer
+
+
+def scenarios(workload):
+    """name -> (role, expected status, function(worker, n) returning (method, path, data))."""
+    rng = workload.rng
+    return {
+        'login': (None, 302, lambda worker, n: (
+            'POST', '/login', {'email': rng.choice(workload.emails), 'password': bench_data.BENCH_PASSWORD})),
+        'dashboard_customer': ('customer', 200, lambda worker, n: ('GET', '/dashboard', None)),
+        'dashboard_engineer': ('engineer', 200, lambda worker, n: ('GET', '/dashboard', None)),
+        'dashboard_admin': ('admin', 200, lambda worker, n: ('GET', '/dashboard', None)),
+        'create': ('customer', 302, lambda worker, n: ('POST', '/create_ticket', {
+            'title': 'benchmark ticket', 'service_type': rng.choice(bench_data.SERVICES),
+            'description': ' '.join(rng.choices(bench_data.WORDS, k=12))})),
+        'resolve': ('engineer', 302, lambda worker, n: (
+            'POST', f'/update_ticket/{workload.resolvable[worker][n]}', {'solution': 'benchmark'})),
+        'mark_notification': ('customer', 302, lambda worker, n: (
+            'GET', f'/mark_notification/{workload.unread[worker][n]}', None)),
+        'search': ('admin', 200, lambda worker, n: (
+            'GET', '/api/search?' + urllib.parse.urlencode({'q': rng.choice(SEARCH_WORDS)}), None)),
+        'analytics': ('admin', 200, lambda worker, n: ('GET', '/analytics', None)),
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_scenario(workload, role, expected, make_request, requests, warmup, concurrency):
+    clients = workload.anonymous if role is None else workload.clients[role]
+    results = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    barrier = threading.Barrier(concurrency + 1)
+    share = -(-requests // concurrency)
+
+    def work(worker):
+        client = clients[worker]
+        for n in range(warmup):
+            client.request(*make_request(worker, n))
+        barrier.wait()
+        for n in range(warmup, warmup + min(share, requests - worker * share)):
+            request = make_request(worker, n)
+            started = time.perf_counter()
+            status, queries = client.request(*request)
+            elapsed = time.perf_counter() - started
+            if status != expected:
+                errors[worker] += 1
+            results[worker].append((elapsed, int(queries) if queries else 0))
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    samples = [sample for worker in results for sample in worker]
+    latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(errors),
+        'seconds': round(seconds, 4),
+        'requests_per_second': round(len(samples) / seconds, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p90': round(percentile(latencies, 0.90), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries_per_request': round(statistics.fmean(queries for _, queries in samples), 2),
+    }
+
+
+def environment():
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=here, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ''
+
+    return {
+        'commit': git('rev-parse', '--short', 'HEAD') or None,
+        'dirty': bool(git('status', '--porcelain', '--', '.')),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, run):
+    print(f'{"scenario":<20} {"req/s":>20} {"p50 ms":>22} {"p99 ms":>22}')
+    for name, result in run['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for old_value, new_value in ((old['requests_per_second'], result['requests_per_second']),
+                                     (old['latency_ms']['p50'], result['latency_ms']['p50']),
+                                     (old['latency_ms']['p99'], result['latency_ms']['p99'])):
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            cells.append(f'{old_value:>8g} -> {new_value:<8g}{change:+5.0f}%')
+        print(f'{name:<20} ' + ' '.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_data.add_arguments(parser)
+    parser.add_argument('--database', help='database made by bench_data.py (default: generate one)')
+    parser.add_argument('--requests', type=int, default=200, help='recorded requests per scenario')
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--server', action='store_true', help='go over HTTP to a local WSGI server')
+    parser.add_argument('--scenario', action='append', help='run only these (repeatable)')
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare with')
+    options = parser.parse_args()
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    run = {'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+           'environment': environment(),
+           'options': {name: value for name, value in vars(options).items()
+                       if name not in ('output', 'baseline')}}
+    if options.database:
+        path = bench_data.copy_database(options.database)
+        models = bench_data.load_app(path)
+    else:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(path)
+        models = bench_data.load_app(path)
+        started = time.perf_counter()
+        run['data'] = bench_data.generate(models.app, models.db, models,
+                                          bench_data.SCALES[options.scale], options.seed)
+        run['data']['generate_seconds'] = round(time.perf_counter() - started, 1)
+        print(f'generated {run["data"]}')
+    app = models.app
+    # Every benchmark client has the same address, so the login throttle would refuse them
+    app.config['LOGIN_RATE_LIMITS'] = {}
+    # Query budget warnings would otherwise be logged for every request
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = None
+    try:
+        if options.server:
+            server, base_url = start_server(app)
+            make_client = lambda: HttpClient(app, base_url)
+        else:
+            make_client = lambda: TestClient(app)
+        per_worker = options.warmup + -(-options.requests // options.concurrency)
+        workload = Workload(models, make_client, options.concurrency, per_worker,
+                            random.Random(options.seed))
+        run['scenarios'] = {}
+        for name, (role, expected, make_request) in scenarios(workload).items():
+            if options.scenario and name not in options.scenario:
+                continue
+            result = run_scenario(workload, role, expected, make_request, options.requests,
+                                  options.warmup, options.concurrency)
+            run['scenarios'][name] = result
+            print(f'{name:<20} {result["requests_per_second"]:>9} req/s  '
+                  f'p50 {result["latency_ms"]["p50"]:>8} ms  p99 {result["latency_ms"]["p99"]:>8} ms  '
+                  f'{result["queries_per_request"]:>5} queries  {result["errors"]} errors')
+    finally:
+        if server is not None:
+            server.shutdown()
+        models.notifications.transport.close()
+        with app.app_context():
+            models.db.engine.dispose()
+        bench_data.remove_database(path)
+
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as output:
+            json.dump(run, output, indent=2, ensure_ascii=False)
+    if baseline is not None:
+        compare(baseline, run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Seeded Users, Tickets and Notifications for the benchmarks.
+
+The same --scale and --seed always produce the same database. Rows are
+loaded through bulk.import_rows into the app's own schema, so the search
+index and statistics triggers run as they do in production.
+
+    python bench_data.py --scale 100k --output /tmp/bench-100k.db
+
+Every generated user's password is BENCH_PASSWORD. Emails are
+customer<n>@bench.local, engineer<n>@bench.local and admin<n>@bench.local.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000}  # tickets; users and notifications follow
+BENCH_PASSWORD = 'bench'
+ADMINS = 3
+SERVICES = ['মেইল', 'ইন্টারনেট', 'সফটওয়্যার', 'অটোমেশন']
+STATUS_WEIGHTS = {'Open': 30, 'In Progress': 25, 'Resolved': 20, 'Confirmed': 25}
+WORDS = ['মেইল', 'পাঠানো', 'যাচ্ছে', 'না', 'ইন্টারনেট', 'ধীর', 'outlook', 'vpn', 'printer', 'password',
+         'reset', 'timeout', 'error', 'license', 'update', 'install', 'backup', 'sync', 'dns', 'proxy']
+GENERATED_AT = datetime(2024, 1, 1)  # fixed, so created_at is reproducible too
+
+
+def sizes(tickets):
+    users = max(100, tickets // 10)
+    engineers = max(5, users // 50)
+    return {'tickets': tickets, 'users': users, 'engineers': engineers,
+            'customers': users - engineers - ADMINS, 'notifications': tickets}
+
+
+def user_ids(counts):
+    # Users are loaded admins first, then engineers, then customers, so ids are known up front
+    engineers = range(ADMINS + 1, ADMINS + counts['engineers'] + 1)
+    customers = range(engineers.stop, engineers.stop + counts['customers'])
+    return engineers, customers
+
+
+def user_rows(counts, password_hash):
+    for role, count in (('admin', ADMINS), ('engineer', counts['engineers']),
+                        ('customer', counts['customers'])):
+        for n in range(1, count + 1):
+            yield {'email': f'{role}{n}@bench.local', 'password': password_hash,
+                   'role': role, 'name': f'{role.title()} {n}'}
+
+
+def ticket_rows(rng, counts):
+    engineers, customers = user_ids(counts)
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    for _ in range(counts['tickets']):
+        status = rng.choices(statuses, weights)[0]
+        yield {
+            'title': ' '.join(rng.choices(WORDS, k=rng.randint(2, 5))),
+            'service_type': rng.choice(SERVICES),
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(8, 25))),
+            'status': status,
+            'solution': ' '.join(rng.choices(WORDS, k=8)) if status in ('Resolved', 'Confirmed') else None,
+            'customer_id': rng.choice(customers),
+            'engineer_id': None if status == 'Open' else rng.choice(engineers),
+            'created_at': (GENERATED_AT - timedelta(seconds=rng.randint(0, 365 * 86400))).isoformat(),
+        }
+
+
+def notification_rows(rng, counts, unread):
+    engineers, customers = user_ids(counts)
+    for _ in range(counts['notifications']):
+        user_id = rng.choice(customers) if rng.random() < 0.8 else rng.choice(engineers)
+        is_read = rng.random() < 0.7
+        if not is_read:
+            unread[user_id] += 1
+        yield {'content': f'Your ticket #{rng.randint(1, counts["tickets"])} has been resolved',
+               'is_read': is_read, 'user_id': user_id}
+
+
+def generate(app, db, models, tickets, seed=42):
+    """Fill the app's (empty) database. Returns the sizes that were loaded."""
+    import bulk
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    counts = sizes(tickets)
+    unread = Counter()
+    with app.app_context():
+        db.create_all()
+        # Hashing is deliberately slow, so every user shares one hash of BENCH_PASSWORD
+        bulk.import_rows(db, models.User, user_rows(counts, generate_password_hash(BENCH_PASSWORD)),
+                         secrets=True)
+        bulk.import_rows(db, models.Service, ({'name': name} for name in SERVICES))
+        bulk.import_rows(db, models.Ticket, ticket_rows(rng, counts))
+        bulk.import_rows(db, models.Notification, notification_rows(rng, counts, unread))
+        user = models.User.__table__
+        db.session.execute(user.update().where(user.c.id == bindparam('user_id'))
+                           .values(unread_count=bindparam('count')),
+                           [{'user_id': user_id, 'count': count} for user_id, count in unread.items()])
+        db.session.commit()
+    return counts
+
+
+def load_app(database_path):
+    """Import app.py with its database pointed at `database_path`."""
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(database_path)}'
+    import app as models
+    return models
+
+
+def copy_database(source):
+    """Copy a generated database to a temporary file, so runs never change the original."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    src, dst = sqlite3.connect(source), sqlite3.connect(path)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return path
+
+
+def remove_database(path):
+    root, extension = os.path.splitext(path)
+    for database in (path, f'{root}-archive{extension}'):  # and the archive.py file next to it
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+
+def add_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES, key=SCALES.get), default='10k')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', required=True, help='database file to create')
+    options = parser.parse_args()
+    if os.path.exists(options.output):
+        parser.error(f'{options.output} already exists')
+    models = load_app(options.output)
+    started = time.perf_counter()
+    counts = generate(models.app, models.db, models, SCALES[options.scale], options.seed)
+    print(f'{counts} loaded in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Publish and consume throughput of the notification pipeline, written as JSON.
+
+    python bench_rabbitmq.py --events 20000 --output rmq.json
+    python bench_rabbitmq.py --broker localhost --baseline rmq.json
+
+Three measurements, on a database generated by bench_data.py:
+
+    inprocess  events through InProcessTransport until they are stored
+    publish    events through RabbitMQTransport until the broker has them all
+    consume    those events through NotificationPipeline.consume until stored
+
+Without --broker, pika.BlockingConnection is replaced by StandInBroker: an
+in-memory queue that answers the same calls. Its numbers are the pipeline's
+own cost (JSON, batching, the SQLite writes) without the network or the
+broker. --publish-latency adds a fixed delay to every basic_publish to
+model one.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+import pika
+from sqlalchemy import text
+
+import bench_app
+import bench_data
+
+Method = namedtuple('Method', 'delivery_tag')
+
+
+class StandInBroker:
+    """In-memory stand-in for the pika.BlockingConnection calls the pipeline makes."""
+
+    def __init__(self, publish_latency=0.0):
+        self.publish_latency = publish_latency
+        self.queues = {}
+        self.condition = threading.Condition()
+
+    def connect(self, parameters=None):
+        return _StandInConnection(self)
+
+    def messages(self, queue_name):
+        with self.condition:
+            return len(self.queues.get(queue_name, ()))
+
+
+class _StandInConnection:
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        return _StandInChannel(self.broker)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class _StandInChannel:
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue_name = None
+        self.unacked = {}
+        self.last_tag = 0
+        self.cancelled = False
+
+    def queue_declare(self, queue, durable=False):
+        with self.broker.condition:
+            self.broker.queues.setdefault(queue, deque())
+
+    def queue_purge(self, queue):
+        with self.broker.condition:
+            self.broker.queues[queue].clear()
+
+    def basic_qos(self, prefetch_count=0):
+        pass
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.broker.publish_latency:
+            time.sleep(self.broker.publish_latency)
+        with self.broker.condition:
+            self.broker.queues[routing_key].append(body)
+            self.broker.condition.notify()
+
+    def consume(self, queue, inactivity_timeout=None):
+        self.queue_name = queue
+        messages = self.broker.queues[queue]
+        while not self.cancelled:
+            with self.broker.condition:
+                if not messages:
+                    self.broker.condition.wait(inactivity_timeout)
+                body = messages.popleft() if messages else None
+            if body is None:
+                yield None, None, None
+                continue
+            self.last_tag += 1
+            self.unacked[self.last_tag] = body
+            yield Method(self.last_tag), None, body
+
+    def _settle(self, delivery_tag, multiple):
+        tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self.unacked.pop(tag) for tag in tags]
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self._settle(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        bodies = self._settle(delivery_tag, multiple)
+        if requeue:
+            with self.broker.condition:
+                self.broker.queues[self.queue_name].extendleft(reversed(bodies))
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class StoredCounter:
+    """NotificationPipeline deliverer that signals once `expected` rows are stored."""
+
+    def __init__(self):
+        self.stored = 0
+        self.expected = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def expect(self, expected):
+        with self._lock:
+            self.stored = 0
+            self.expected = expected
+            self.done.clear()
+
+    def __call__(self, notifications):
+        with self._lock:
+            self.stored += len(notifications)
+            if self.expected is not None and self.stored >= self.expected:
+                self.done.set()
+
+
+def result(events, seconds, **extra):
+    return {'events': events, 'seconds': round(seconds, 4),
+            'events_per_second': round(events / seconds, 1), **extra}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_data.add_arguments(parser)
+    parser.add_argument('--database', help='database made by bench_data.py (default: generate one)')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--broker', help='RabbitMQ host (default: in-memory stand-in)')
+    parser.add_argument('--publish-latency', type=float, default=0.0,
+                        help='seconds added to each stand-in publish')
+    parser.add_argument('--timeout', type=float, default=300, help='give up on a measurement after this')
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare with')
+    options = parser.parse_args()
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    from notifications import QUEUE_NAME, InProcessTransport, RabbitMQTransport
+
+    host = options.broker
+    broker = None
+    if host is None:
+        broker = StandInBroker(options.publish_latency)
+        pika.BlockingConnection = broker.connect
+        host = 'stand-in'
+
+    run = {'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+           'environment': bench_app.environment(),
+           'options': {name: value for name, value in vars(options).items()
+                       if name not in ('output', 'baseline')}}
+    if options.database:
+        path = bench_data.copy_database(options.database)
+        models = bench_data.load_app(path)
+    else:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(path)
+        models = bench_data.load_app(path)
+        run['data'] = bench_data.generate(models.app, models.db, models,
+                                          bench_data.SCALES[options.scale], options.seed)
+    logging.getLogger('notifications').setLevel(logging.ERROR)
+    pipeline = models.notifications
+    stored = StoredCounter()
+    pipeline.add_deliverer(stored)
+    with models.app.app_context():
+        customers = models.db.session.execute(
+            text("SELECT id FROM user WHERE role = 'customer' ORDER BY id LIMIT 1000")).scalars().all()
+    events = [{'type': 'resolved', 'ticket_id': n + 1, 'customer_id': customers[n % len(customers)],
+               'engineer_id': None} for n in range(options.events)]
+
+    def timed_store(start):
+        stored.expect(len(events))
+        started = time.perf_counter()
+        start()
+        if not stored.done.wait(options.timeout):
+            raise SystemExit(f'only {stored.stored} of {len(events)} notifications stored '
+                             f'within {options.timeout}s')
+        return time.perf_counter() - started
+
+    run['results'] = {}
+    try:
+        transport = InProcessTransport(pipeline.writer, max_pending=len(events))
+
+        def publish_in_process():
+            for event in events:
+                transport.publish(event)
+        run['results']['inprocess'] = result(len(events), timed_store(publish_in_process),
+                                             dropped=transport.dropped)
+        transport.close()
+
+        setup = pika.BlockingConnection(pika.ConnectionParameters(host))
+        channel = setup.channel()
+        channel.queue_declare(queue=QUEUE_NAME, durable=True)
+        channel.queue_purge(QUEUE_NAME)
+        setup.close()
+        publisher = RabbitMQTransport(host, max_pending=len(events))
+        started = time.perf_counter()
+        for event in events:
+            publisher.publish(event)
+        publisher.close(timeout=options.timeout)
+        run['results']['publish'] = result(len(events), time.perf_counter() - started,
+                                           dropped=publisher.dropped,
+                                           queued=broker.messages(QUEUE_NAME) if broker else None)
+
+        consumer = threading.Thread(target=pipeline.consume, args=(host,), name='bench-consumer',
+                                    daemon=True)
+        run['results']['consume'] = result(len(events), timed_store(consumer.start))
+    finally:
+        pipeline.transport.close()
+        with models.app.app_context():
+            models.db.engine.dispose()
+        bench_data.remove_database(path)
+
+    for name, measured in run['results'].items():
+        line = f'{name:<10} {measured["events_per_second"]:>10} events/s'
+        if baseline is not None and name in baseline.get('results', {}):
+            old = baseline['results'][name]['events_per_second']
+            line += f'  (was {old}, {(measured["events_per_second"] - old) / old * 100:+.0f}%)'
+        print(line)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as output:
+            json.dump(run, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
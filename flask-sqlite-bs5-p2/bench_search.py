@@ -0,0 +1,115 @@
+"""Benchmark search.search() (FTS5) against a LIKE scan.
+
+Ticket text draws words from a Zipf-distributed vocabulary, so some query
+words match a large share of tickets and others only a handful.
+
+    python bench_search.py --tickets 1000000 --queries 50
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import search
+
+WORDS = [
+    'মেইল', 'পাঠানো', 'যাচ্ছে', 'ইনবক্স', 'পাসওয়ার্ড', 'লগইন', 'সংযোগ', 'ধীর', 'রাউটার', 'ওয়াইফাই',
+    'outlook', 'smtp', 'imap', 'vpn', 'dns', 'timeout', 'error', 'crash', 'license', 'update',
+    'install', 'printer', 'password', 'reset', 'blocked', 'attachment', 'quota', 'latency', 'proxy',
+    'certificate', 'sync', 'calendar', 'backup', 'restore', 'driver', 'browser', 'cache', 'port',
+]
+VOCABULARY = WORDS + [f'{prefix}{n}' for prefix in ('err', 'model', 'host') for n in range(3000)]
+ZIPF_CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+CUSTOMERS = 5000
+
+
+def words(rng, low, high):
+    return ' '.join(rng.choices(VOCABULARY, cum_weights=ZIPF_CUM_WEIGHTS, k=rng.randint(low, high)))
+
+
+def create(path, tickets, rng):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE ticket (id INTEGER PRIMARY KEY, title VARCHAR(100), '
+                 'description VARCHAR(500), solution VARCHAR(500), customer_id INTEGER)')
+    conn.execute('CREATE INDEX ix_ticket_customer ON ticket (customer_id)')
+    chunk = 10000
+    for start in range(0, tickets, chunk):
+        rows = [(words(rng, 3, 6), words(rng, 10, 30), words(rng, 5, 15) if rng.random() < 0.5 else None,
+                 rng.randint(1, CUSTOMERS))
+                for _ in range(min(chunk, tickets - start))]
+        conn.executemany('INSERT INTO ticket (title, description, solution, customer_id) '
+                         'VALUES (?, ?, ?, ?)', rows)
+        conn.commit()
+    return conn
+
+
+def timed(run, queries):
+    started = time.perf_counter()
+    for query in queries:
+        run(*query)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    options = parser.parse_args()
+    rng = random.Random(options.seed)
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        conn = create(path, options.tickets, rng)
+        print(f'{options.tickets} tickets loaded in {time.perf_counter() - started:.1f}s')
+        engine = create_engine(f'sqlite:///{path}')
+        session = Session(engine)
+        started = time.perf_counter()
+        search.rebuild(session)  # what `flask search-index` runs
+        print(f'search index built in {time.perf_counter() - started:.1f}s')
+
+        def fts(text, customer_id):
+            return search.search(session, text, customer_id, page_size=options.page_size)
+
+        def like(text, customer_id):
+            pattern = f'%{text}%'
+            scope = 'AND customer_id = ?' if customer_id is not None else ''
+            params = [pattern] * 3 + ([customer_id] if customer_id is not None else [])
+            return conn.execute('SELECT id FROM ticket WHERE (title LIKE ? OR description LIKE ? '
+                                f'OR solution LIKE ?) {scope} LIMIT {options.page_size}',
+                                params).fetchall()
+
+        # Vocabulary ranks: common words match many tickets, tail words only a few
+        bands = [('common word', VOCABULARY[:10]), ('mid word', VOCABULARY[40:400]),
+                 ('rare word', VOCABULARY[-100:]), ('no match', ['zzz', 'qqq', 'xyzzy'])]
+        print(f'{"search":<8} {"query":<14} {"scope":<10} {"mean ms":>9}')
+        for label, band in bands:
+            for scope in ('all', 'customer'):
+                queries = [(rng.choice(band), rng.randint(1, CUSTOMERS) if scope == 'customer' else None)
+                           for _ in range(options.queries)]
+                for name, run in (('fts5', fts), ('like', like)):
+                    # LIKE scans are slow; a few queries give a stable mean
+                    sample = queries if name == 'fts5' else queries[:max(1, options.queries // 10)]
+                    print(f'{name:<8} {label:<14} {scope:<10} {timed(run, sample):>9.2f}')
+        session.close()
+        engine.dispose()
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+
+class CacheStats:
+    hits = 0
+    misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None}
+
+
+class TTLCache(CacheStats):
+    """Thread-safe in-process cache; entries expire after `ttl` seconds.
+
+    With `maxsize`, the least recently used entry is evicted once full.
+
+    With `shared_file`, deleting a key also tells every other process on
+    the host: delete() appends a byte to the file, and get() empties this
+    process's cache when the file's size has changed since it last looked.
+    That costs one stat() per lookup and drops the whole cache on every
+    change, which suits data that is read far more than it is written.
+    Processes on other hosts aren't told; use RedisCache there.
+    """
+
+    def __init__(self, ttl=300, maxsize=None, shared_file=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.shared_file = shared_file
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = self._read_generation()
+
+    def _read_generation(self):
+        if self.shared_file is None:
+            return 0
+        try:
+            return os.stat(self.shared_file).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _bump_generation(self):
+        if self.shared_file is not None:
+            # O_APPEND writes are atomic, so concurrent bumps each grow the file
+            fd = os.open(self.shared_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b'.')
+            finally:
+                os.close(fd)
+
+    def get(self, key):
+        generation = self._read_generation()
+        with self._lock:
+            if generation != self._generation:
+                self._data.clear()
+                self._generation = generation
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        self._bump_generation()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self._bump_generation()
+
+
+class RedisCache(CacheStats):
+    """Cache shared by every worker process. Values must be JSON-serializable."""
+
+    def __init__(self, url, ttl=300, prefix='ticketing:'):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_cache(app, ttl=None, maxsize=None, prefix='ticketing:'):
+    if ttl is None:
+        ttl = app.config.get('CACHE_TTL', 300)
+    if app.config.get('CACHE_REDIS_URL'):
+        # Redis bounds itself with maxmemory; entries still expire after ttl
+        return RedisCache(app.config['CACHE_REDIS_URL'], ttl, prefix)
+    # Workers of one host tell each other about deletes through this file
+    directory = app.config.get('CACHE_SHARED_DIR') or app.instance_path
+    os.makedirs(directory, exist_ok=True)
+    name = prefix.strip(':').replace(':', '-') + '.generation'
+    return TTLCache(ttl, maxsize, shared_file=os.path.join(directory, name))
+
+
+def invalidate_on_change(model, cache, key):
+    """Drop `key` from `cache` once a transaction touching `model` commits.
+
+    `key` may be a function of the changed row, for per-row entries.
+    Invalidating at commit rather than at flush stops another request from
+    re-caching the old rows while the change is still uncommitted.
+    """
+    def mark(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('invalidate_cache_keys', set()).add(
+                (cache, key(target) if callable(key) else key))
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, mark)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for cache, key in session.info.pop('invalidate_cache_keys', ()):
+        cache.delete(key)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('invalidate_cache_keys', None)
@@ -0,0 +1,254 @@
+"""Throttling and bounded password hashing for login and register.
+
+    login_protection = LoginProtection(app)
+
+    retry_after = login_protection.throttle('login', ip=request.remote_addr, email=email)
+    valid, new_hash = login_protection.hasher.verify(user.password, password)
+
+throttle() takes one token from a bucket per key before any hashing is
+done. Each scope's limits come from <SCOPE>_RATE_LIMITS in the config, a
+dict of key name -> (attempts, seconds): a bucket holds `attempts` tokens
+and refills at attempts/seconds per second. Buckets live in this process
+(BucketStore), or in Redis with RATE_LIMIT_REDIS_URL so that every worker
+shares them. An empty dict turns a scope's throttling off. Behind a
+reverse proxy, remote_addr is the proxy's address unless the app is
+wrapped in werkzeug's ProxyFix.
+
+Hashes are computed by PasswordHasher on PASSWORD_HASH_WORKERS threads.
+hashlib releases the GIL while it hashes, so hashing uses at most that
+many cores whatever the load. Requests wait for their hash. Once
+PASSWORD_HASH_QUEUE more are waiting, or one has waited
+PASSWORD_HASH_TIMEOUT seconds, HashingBusy is raised at once instead. A
+burst of logins then gets fast errors, and the request threads stay free
+for everything else.
+
+Each worker process has its own pool, so processes x PASSWORD_HASH_WORKERS
+must stay below the number of CPUs. With more processes than that allows,
+set PASSWORD_HASH_WORKERS to 0: each process hashes on one thread, and a
+hash first takes one of PASSWORD_HASH_CPUS slots shared by every process
+on the host (SharedSlots, lock files in PASSWORD_HASH_LOCK_DIR).
+gunicorn.conf.py sets both from the CPUs and workers it starts.
+
+verify() also re-hashes a correct password whose hash was made with a
+method other than PASSWORD_HASH_METHOD (None = werkzeug's default), so
+raising the cost upgrades users as they log in.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """The password hashing pool has no room for another request."""
+
+
+class BucketStore:
+    """In-process token buckets, least recently used evicted beyond `maxsize` keys."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, attempts, seconds):
+        """Take one token. Returns 0 if allowed, else the seconds until one is available."""
+        rate = attempts / seconds
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (attempts, now))
+            tokens = min(attempts, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker process, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local attempts, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or attempts
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(attempts, tokens + math.max(0, now - updated_at) * rate)
+    local allowed = tokens >= 1
+    if allowed then tokens = tokens - 1 end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(attempts / rate) + 1)
+    if allowed then return '0' end
+    return tostring((1 - tokens) / rate)
+    """
+
+    def __init__(self, url, prefix='ticketing:bucket:'):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, attempts, seconds):
+        return float(self._take(keys=[self.prefix + key], args=[attempts, attempts / seconds]))
+
+
+def make_bucket_store(app):
+    if app.config.get('RATE_LIMIT_REDIS_URL'):
+        return RedisBucketStore(app.config['RATE_LIMIT_REDIS_URL'])
+    return BucketStore(app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+
+class SharedSlots:
+    """At most `slots` holders at once across every process, through flock()ed files in `directory`."""
+
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, slots, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'slot-{n}.lock') for n in range(slots)]
+
+    def _try_lock(self, path):
+        import fcntl  # Unix only, like the worker processes that need it
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @contextmanager
+    def hold(self, timeout):
+        """Hold a free slot; HashingBusy if none is free within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for path in self.paths:
+                fd = self._try_lock(path)
+                if fd is not None:
+                    try:
+                        yield
+                    finally:
+                        # Closing releases the lock, as does the process exiting
+                        os.close(fd)
+                    return
+            if time.monotonic() >= deadline:
+                raise HashingBusy()
+            time.sleep(self.POLL_INTERVAL)
+
+
+class PasswordHasher:
+    """werkzeug password hashing on a bounded pool of threads.
+
+    workers=0 hashes on one thread, each hash holding a slot of `shared`.
+    """
+
+    def __init__(self, workers=1, max_pending=8, timeout=10, method=None, shared=None):
+        if not workers and shared is None:
+            raise ValueError('workers=0 needs shared slots')
+        self.timeout = timeout
+        self.method = method
+        self.shared = shared if not workers else None
+        workers = workers or 1
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._current_method = None
+
+    def _call(self, function, *args):
+        if self.shared is None:
+            return function(*args)
+        with self.shared.hold(self.timeout):
+            return function(*args)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(self._call, function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash is done, even if the caller stopped waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise HashingBusy() from None
+
+    def _generate(self, password):
+        if self.method is None:
+            return generate_password_hash(password)
+        return generate_password_hash(password, method=self.method)
+
+    def _is_current(self, pwhash):
+        if self._current_method is None:
+            # werkzeug fills in its defaults (e.g. scrypt -> scrypt:32768:8:1), so ask it
+            self._current_method = self._generate('').split('$', 1)[0]
+        return pwhash.split('$', 1)[0] == self._current_method
+
+    def _verify(self, pwhash, password):
+        if not check_password_hash(pwhash, password):
+            return False, None
+        return True, None if self._is_current(pwhash) else self._generate(password)
+
+    def generate(self, password):
+        return self._run(self._generate, password)
+
+    def verify(self, pwhash, password):
+        """(True, new_hash or None) for the right password, else (False, None).
+
+        new_hash is set when `pwhash` was made with another method and
+        should replace it.
+        """
+        return self._run(self._verify, pwhash, password)
+
+
+class LoginProtection:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_RATE_LIMITS', {'ip': (20, 60), 'email': (5, 300)})
+        app.config.setdefault('REGISTER_RATE_LIMITS', {'ip': (5, 3600)})
+        app.config.setdefault('PASSWORD_HASH_METHOD', None)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 1)
+        app.config.setdefault('PASSWORD_HASH_CPUS', 1)
+        app.config.setdefault('PASSWORD_HASH_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'password-hash-slots'))
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 8)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.app = app
+        self.buckets = make_bucket_store(app)
+        shared = None
+        if not app.config['PASSWORD_HASH_WORKERS']:
+            shared = SharedSlots(app.config['PASSWORD_HASH_CPUS'], app.config['PASSWORD_HASH_LOCK_DIR'])
+        self.hasher = PasswordHasher(app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE'],
+                                     app.config['PASSWORD_HASH_TIMEOUT'], app.config['PASSWORD_HASH_METHOD'],
+                                     shared)
+
+    def throttle(self, scope, **keys):
+        """Take a token for each key in turn. Returns 0 if allowed, else seconds to wait.
+
+        Keys after the first refused one keep their tokens, so a client
+        refused by its address can't also use up an account's bucket.
+        """
+        limits = self.app.config[f'{scope.upper()}_RATE_LIMITS']
+        for name, value in keys.items():
+            if name in limits and value:
+                attempts, seconds = limits[name]
+                retry_after = self.buckets.take(f'{scope}:{name}:{value}', attempts, seconds)
+                if retry_after:
+                    return retry_after
+        return 0
@@ -0,0 +1,135 @@
+"""Per-user in-memory pub/sub for live notifications (Server-Sent Events).
+
+The hub is registered as a NotificationPipeline deliverer, so every batch
+of stored notifications is pushed to the open streams of its recipients.
+A push only wakes a stream up; it then reads the new rows from the
+database. A stream also re-checks every `recheck_interval` seconds,
+which picks up notifications written by another process (a second web
+worker or notification_worker.py) and doubles as the keep-alive.
+
+An open stream holds a server thread for as long as the page is open, so
+at most `max_streams` are held at once. Past that, a request is answered
+as a poll: the missed notifications and the unread count, then the
+response ends with a retry field, and the browser's EventSource connects
+again `recheck_interval` seconds later. Pages then update a little later
+instead of the server running out of threads.
+"""
+import json
+import queue
+import threading
+from collections import defaultdict
+
+
+class NotificationHub:
+
+    def __init__(self, max_pending=100, max_streams=None):
+        self.max_pending = max_pending
+        self.max_streams = max_streams  # None = no limit
+        self._subscribers = defaultdict(set)
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def open_stream(self):
+        """Reserve a long-lived stream; False once `max_streams` are open."""
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def subscribe(self, user_id):
+        # A full queue only drops the push; the stream's re-check still finds the row.
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _send(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def publish(self, notifications):
+        """Deliverer: push each stored notification to its recipient's streams."""
+        for notification in notifications:
+            self._send(notification['user_id'], ('notification', notification))
+
+    def read_changed(self, user_id):
+        """Tell the user's streams to refresh their unread count."""
+        self._send(user_id, ('read', None))
+
+
+def sse(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def poll(user_id, last_id, fetch_since, count_unread, retry):
+    """Yield what a stream would send first, telling the browser to reconnect in `retry` seconds."""
+    yield f'retry: {int(retry * 1000)}\n\n'
+    for notification in fetch_since(user_id, last_id):
+        yield sse('notification', notification, event_id=notification['id'])
+    yield sse('unread', {'count': count_unread(user_id)})
+
+
+def stream(hub, user_id, last_id, fetch_since, count_unread, recheck_interval=15):
+    """Yield SSE messages for `user_id`, starting after notification `last_id`.
+
+    fetch_since(user_id, last_id) -> notification dicts with a larger id, in id order
+    count_unread(user_id) -> int
+
+    Falls back to poll() when the hub has no room for another stream.
+    """
+    if not hub.open_stream():
+        yield from poll(user_id, last_id, fetch_since, count_unread, recheck_interval)
+        return
+    subscriber = hub.subscribe(user_id)
+    try:
+        # Subscribed before the first query, so nothing stored in between is missed.
+        # A push only wakes the stream up: rows are always read from the database
+        # in id order, so a row another process stored with a lower id is not skipped.
+        unread = None
+        while True:
+            for notification in fetch_since(user_id, last_id):
+                last_id = notification['id']
+                yield sse('notification', notification, event_id=last_id)
+            count = count_unread(user_id)
+            if count != unread:
+                unread = count
+                yield sse('unread', {'count': unread})
+            else:
+                yield ': keep-alive\n\n'
+            try:
+                subscriber.get(timeout=recheck_interval)
+            except queue.Empty:
+                continue
+            # One read covers a burst of pushes
+            while True:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+    finally:
+        hub.unsubscribe(user_id, subscriber)
+        hub.close_stream()
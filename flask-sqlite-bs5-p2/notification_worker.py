@@ -0,0 +1,16 @@
+"""Writes notifications for ticket events published to RabbitMQ.
+
+Only needed when NOTIFICATION_RABBITMQ_HOST is set; run one or more next
+to the web workers:
+
+    python notification_worker.py
+"""
+import logging
+
+from app import app, init_db, notifications
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print('Waiting for ticket events. To exit press CTRL+C')
+    notifications.consume(app.config['NOTIFICATION_RABBITMQ_HOST'] or 'localhost')
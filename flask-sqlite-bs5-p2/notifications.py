@@ -0,0 +1,358 @@
+"""Notification fan-out for ticket events.
+
+Request handlers only call pipeline.emit(event); the event is handed to a
+transport once the request's transaction commits, and the handler returns
+without waiting for notifications to be written.
+
+With NOTIFICATION_RABBITMQ_HOST set, events are published to RabbitMQ and
+written by notification_worker.py. Without it a background thread in the
+web process does the same work from an in-memory queue.
+
+Either way events are written in batches: fan_out(event) turns each event
+into (user_id, content) pairs, one executemany INSERT stores the batch and
+every function registered with add_deliverer() is then called with the
+stored notifications. With `unread_counter` (a column on the recipient
+model, e.g. User.unread_count) the same transaction adds each recipient's
+new notifications to the counter.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import bindparam, event as sa_event
+from sqlalchemy.orm import Session
+
+from instrumentation import PUBLISH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_NAME = 'ticket_events'
+DEAD_LETTER_QUEUE = 'ticket_events.dead'
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds a partial batch may wait before it is written
+
+_STOP = object()
+
+
+class NotificationWriter:
+    """Stores a batch of events as Notification rows and delivers them."""
+
+    def __init__(self, app, db, notification_model, fan_out, unread_counter=None):
+        self.app = app
+        self.db = db
+        self.table = notification_model.__table__
+        self.fan_out = fan_out
+        self.unread_counter = unread_counter
+        self.deliverers = []
+
+    def _count_unread(self, notifications):
+        recipients = self.unread_counter.class_.__table__
+        counter = recipients.c[self.unread_counter.key]
+        added = Counter(notification['user_id'] for notification in notifications)
+        self.db.session.execute(
+            recipients.update()
+            .where(recipients.c.id == bindparam('recipient_id'))
+            .values({counter: counter + bindparam('added')}),
+            [{'recipient_id': user_id, 'added': count} for user_id, count in added.items()])
+
+    def write(self, events):
+        rows = [{'user_id': user_id, 'content': content}
+                for event in events
+                for user_id, content in self.fan_out(event)
+                if user_id is not None]
+        if not rows:
+            return []
+        table = self.table
+        with self.app.app_context():
+            try:
+                result = self.db.session.execute(
+                    table.insert().returning(table.c.id, table.c.user_id, table.c.content), rows)
+                notifications = [dict(row._mapping) for row in result]
+                if self.unread_counter is not None:
+                    self._count_unread(notifications)
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+        for deliver in self.deliverers:
+            try:
+                deliver(notifications)
+            except Exception:
+                logger.exception('Notification delivery failed in %r', deliver)
+        return notifications
+
+
+class InProcessTransport:
+    """Writes events from a daemon thread in this process."""
+
+    def __init__(self, writer, max_pending=10000):
+        self.writer = writer
+        self.events = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-writer',
+                                                daemon=True)
+                self._thread.start()
+
+    def publish(self, event):
+        self.start()
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning('Notification queue full, dropping event: %s', event)
+
+    def close(self, timeout=5):
+        """Write what is already queued and stop the thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.events.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.events.get()
+            batch = []
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= BATCH_SIZE or remaining <= 0:
+                    break
+                try:
+                    item = self.events.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.writer.write(batch)
+                except Exception:
+                    logger.exception('Failed to write %d notification events', len(batch))
+
+
+class RabbitMQTransport:
+    """Publishes events to RabbitMQ from a dedicated I/O thread.
+
+    Requests only put events on a bounded in-memory queue (a full queue
+    drops the event and counts it in `dropped`). The I/O thread owns the
+    pika connection, since pika connections are not thread-safe, and
+    re-opens it with exponential backoff.
+    """
+
+    def __init__(self, host, queue_name=QUEUE_NAME, max_pending=10000,
+                 min_backoff=0.5, max_backoff=30):
+        import pika  # optional dependency, only needed for this transport
+
+        self.pika = pika
+        self.parameters = pika.ConnectionParameters(host, heartbeat=60)
+        self.queue_name = queue_name
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.events = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.connection = None
+        self.channel = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-publisher',
+                                                daemon=True)
+                self._thread.start()
+
+    def publish(self, event):
+        self.start()
+        try:
+            self.events.put_nowait(self._encode(event))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning('Notification queue full, dropping event: %s', event)
+
+    def close(self, timeout=5):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.events.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _encode(self, event):
+        return json.dumps(event)
+
+    def _connect(self):
+        self.connection = self.pika.BlockingConnection(self.parameters)
+        self.channel = self.connection.channel()
+        self._declare()
+
+    def _declare(self):
+        self.channel.queue_declare(queue=self.queue_name, durable=True)
+
+    def _basic_publish(self, body):
+        self.channel.basic_publish(exchange='', routing_key=self.queue_name, body=body,
+                                   properties=self.pika.BasicProperties(delivery_mode=2))
+
+    def _disconnect(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except self.pika.exceptions.AMQPConnectionError:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def _send(self, body):
+        errors = (self.pika.exceptions.AMQPConnectionError, self.pika.exceptions.AMQPChannelError)
+        backoff = self.min_backoff
+        while True:
+            try:
+                if self.connection is None or not self.connection.is_open:
+                    self._connect()
+                with PUBLISH_LATENCY.time(self.queue_name, 'message'):
+                    self._basic_publish(body)
+                return
+            except errors as e:
+                logger.warning('RabbitMQ publish failed (%s), retrying in %.1fs', e, backoff)
+                self._disconnect()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _run(self):
+        while True:
+            try:
+                body = self.events.get(timeout=1)
+            except queue.Empty:
+                if self.connection is not None:
+                    try:
+                        self.connection.process_data_events(0)
+                    except self.pika.exceptions.AMQPError:
+                        self._disconnect()
+                continue
+            if body is _STOP:
+                self._disconnect()
+                return
+            self._send(body)
+
+
+class NotificationPipeline:
+
+    def __init__(self, app, db, notification_model, fan_out, unread_counter=None):
+        self.writer = NotificationWriter(app, db, notification_model, fan_out, unread_counter)
+        host = app.config.get('NOTIFICATION_RABBITMQ_HOST')
+        if host:
+            self.transport = RabbitMQTransport(host)
+        else:
+            self.transport = InProcessTransport(self.writer)
+        atexit.register(self.transport.close)
+
+    def add_deliverer(self, deliver):
+        """Call deliver(notifications) after each batch is stored."""
+        self.writer.deliverers.append(deliver)
+        return deliver
+
+    def emit(self, session, event):
+        """Queue `event` for fan-out once `session` commits; dropped on rollback."""
+        session.info.setdefault('notification_events', []).append((self, event))
+
+    def consume(self, host, queue_name=QUEUE_NAME):
+        """Blocking RabbitMQ consumer used by notification_worker.py."""
+        import pika
+
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host))
+        channel = connection.channel()
+        channel.queue_declare(queue=queue_name, durable=True)
+        channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+        # The broker must be allowed to hand us a full batch before the first ack.
+        channel.basic_qos(prefetch_count=BATCH_SIZE)
+
+        batch = []
+        first_received = None
+        try:
+            for method, properties, body in channel.consume(queue_name,
+                                                            inactivity_timeout=FLUSH_INTERVAL):
+                if method is not None:
+                    if not batch:
+                        first_received = time.monotonic()
+                    batch.append((method.delivery_tag, method.redelivered, body))
+                if batch and (len(batch) >= BATCH_SIZE
+                              or time.monotonic() - first_received >= FLUSH_INTERVAL):
+                    self._flush(channel, batch)
+                    batch = []
+        except KeyboardInterrupt:
+            if batch:
+                self._flush(channel, batch)
+        finally:
+            channel.cancel()
+            connection.close()
+
+    def _flush(self, channel, batch):
+        last_tag = batch[-1][0]
+        try:
+            self.writer.write([json.loads(body) for _, _, body in batch])
+        except Exception:
+            logger.exception('Failed to write %d notification events, retrying one by one',
+                             len(batch))
+            for delivery_tag, redelivered, body in batch:
+                self._flush_one(channel, delivery_tag, redelivered, body)
+        else:
+            channel.basic_ack(delivery_tag=last_tag, multiple=True)
+
+    def _flush_one(self, channel, delivery_tag, redelivered, body):
+        """Write one event; a bad or twice-failed event goes to the dead-letter queue."""
+        try:
+            event = json.loads(body)
+        except ValueError as e:
+            self._dead_letter(channel, body, e)
+            channel.basic_ack(delivery_tag=delivery_tag)
+            return
+        try:
+            self.writer.write([event])
+        except Exception as e:
+            if redelivered:
+                logger.error('Notification event failed again, moving it to %s: %s',
+                             DEAD_LETTER_QUEUE, e)
+                self._dead_letter(channel, body, e)
+                channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        else:
+            channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _dead_letter(self, channel, body, error):
+        import pika
+
+        # Published before the ack, so a crash in between leaves a copy in both queues, never neither
+        channel.basic_publish(exchange='', routing_key=DEAD_LETTER_QUEUE, body=body,
+                              properties=pika.BasicProperties(delivery_mode=2,
+                                                              headers={'x-error': str(error)[:500]}))
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for pipeline, event in session.info.pop('notification_events', ()):
+        pipeline.transport.publish(event)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('notification_events', None)
@@ -0,0 +1,65 @@
+"""Per-request SQL statement counting for the Flask apps in this repository.
+
+    budget = QueryBudget(app)
+
+    @app.route('/dashboard')
+    @budget.limit(3)
+    def dashboard(): ...
+
+Every statement run inside a request is counted. When QUERY_BUDGET_ENFORCE
+is on (the default under app.testing) a request that runs more statements
+than its route allows raises QueryBudgetExceeded, so an N+1 regression
+fails the test that hits the route; otherwise it is only logged.
+"""
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_statements.append(statement)
+
+
+class QueryBudget:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_BUDGET_DEFAULT', None)  # None = routes without limit() are not checked
+        app.before_request(self._start)
+        app.after_request(self._check)
+        self.app = app
+
+    @staticmethod
+    def limit(max_queries):
+        def decorator(view):
+            view.query_budget = max_queries
+            return view
+        return decorator
+
+    def _start(self):
+        g.query_count = 0
+        g.query_statements = []
+
+    def _check(self, response):
+        view = self.app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', self.app.config['QUERY_BUDGET_DEFAULT'])
+        count = g.pop('query_count', 0)
+        statements = g.pop('query_statements', [])
+        if budget is not None and count > budget:
+            message = (f'{request.method} {request.path} ran {count} SQL statements, '
+                       f'budget is {budget}:\n' + '\n'.join(statements))
+            if self.app.config.get('QUERY_BUDGET_ENFORCE', self.app.testing):
+                raise QueryBudgetExceeded(message)
+            self.app.logger.warning(message)
+        response.headers['X-Query-Count'] = str(count)
+        return response
@@ -0,0 +1,79 @@
+"""Brings a database made by an older version of the app up to date.
+
+db.create_all() creates missing tables but never changes a table that
+already exists, so a database from before a column or index was added
+(like the one shipped in instance/) would fail on the first query that
+uses it. upgrade() adds what is missing and leaves everything else alone,
+so it is safe to run on every start:
+
+    upgrade(db.session, db.metadata, backfills={'user.unread_count': '...'})
+
+- Columns are added with ALTER TABLE ... ADD COLUMN, with the model's
+  server_default, then filled by the column's backfill statement, if any.
+  A NOT NULL column needs a server_default for SQLite to add it.
+- Indexes of the main schema are created if missing.
+- Extras are (table, rebuild) pairs for tables the models don't declare,
+  such as the search index: rebuild(session) runs when the table is missing.
+- DATETIME values written by CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS') are
+  rewritten once in SQLAlchemy's format, which always has microseconds.
+  SQLite compares them as strings, so with both formats in one column
+  rows don't sort by time and a keyset cursor skips or repeats them.
+  PRAGMA user_version records that this has been done.
+"""
+from sqlalchemy import DateTime, inspect
+from sqlalchemy.schema import CreateColumn
+
+DATETIME_FORMAT_VERSION = 1
+
+
+def add_column(connection, column):
+    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE "{column.table.name}" ADD COLUMN {ddl}')
+
+
+def normalise_datetimes(connection, table):
+    """Add the missing fraction to DATETIME values. Returns the columns changed."""
+    changed = []
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            result = connection.exec_driver_sql(
+                f'UPDATE "{table.name}" SET "{column.name}" = "{column.name}" || \'.000000\' '
+                f'WHERE length("{column.name}") = 19')
+            if result.rowcount:
+                changed.append(f'{table.name}.{column.name} format')
+    return changed
+
+
+def upgrade(session, metadata, backfills=None, extras=()):
+    """Add missing columns, indexes and extra tables. Returns what was added."""
+    backfills = backfills or {}
+    connection = session.connection()
+    inspector = inspect(connection)
+    added = []
+    datetimes_done = connection.exec_driver_sql('PRAGMA user_version').scalar() >= DATETIME_FORMAT_VERSION
+    for table in metadata.sorted_tables:
+        if table.schema is not None or not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                add_column(connection, column)
+                name = f'{table.name}.{column.name}'
+                if name in backfills:
+                    session.execute(backfills[name])
+                added.append(name)
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                added.append(index.name)
+        if not datetimes_done:
+            added += normalise_datetimes(connection, table)
+    if not datetimes_done:
+        connection.exec_driver_sql(f'PRAGMA user_version = {DATETIME_FORMAT_VERSION}')
+    session.commit()
+    for table_name, rebuild in extras:
+        if not inspect(session.connection()).has_table(table_name):
+            rebuild(session)
+            added.append(table_name)
+    return added
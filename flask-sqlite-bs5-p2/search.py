@@ -0,0 +1,131 @@
+"""Full-text ticket search backed by an SQLite FTS5 table.
+
+ticket_fts is an external-content index over ticket.title, description and
+solution. customer_id is indexed too, so a customer's search intersects
+two posting lists instead of joining every match back to the ticket
+table. It stores only the index, and triggers on the ticket table keep
+it in step with every INSERT, UPDATE and DELETE (ORM or bulk). install()
+creates it together with the ticket table; for a database that already
+has tickets run `flask search-index`, which creates and rebuilds it.
+
+Results are ranked by bm25 with the title weighted highest and paginated
+with a (rank, id) cursor, like the dashboard's (created_at, id) cursor.
+Only the newest RANK_WINDOW matches are ranked: scoring every match of a
+word that appears in most tickets costs time in proportion to the table,
+while the newest few thousand keep a search for it fast and useful.
+"""
+from collections import namedtuple
+
+from sqlalchemy import DDL, bindparam, event, text
+
+Hit = namedtuple('Hit', 'id score snippet')
+
+FTS_TABLE = 'ticket_fts'
+# unicode61 splits words at Bengali vowel signs and other combining marks
+# (মেইল -> ম, ইল); listing them as token characters keeps words whole.
+BENGALI_MARKS = '\u0981\u0982\u0983\u09bc\u09be\u09bf\u09c0\u09c1\u09c2\u09c3\u09c4' \
+                '\u09c7\u09c8\u09cb\u09cc\u09cd\u09d7\u09e2\u09e3'
+# bm25 column weights: title, description, solution, customer_id
+RANK = 'bm25(10.0, 4.0, 1.0, 0.0)'
+RANK_WINDOW = 5000
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, solution, customer_id,
+        content='ticket', content_rowid='id', tokenize="unicode61 tokenchars '{BENGALI_MARKS}'")""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES('rank', '{RANK}')",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_fts_insert AFTER INSERT ON ticket BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, solution, customer_id)
+        VALUES (new.id, new.title, new.description, new.solution, new.customer_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_fts_delete AFTER DELETE ON ticket BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, solution, customer_id)
+        VALUES ('delete', old.id, old.title, old.description, old.solution, old.customer_id);
+    END""",
+    # Status or engineer changes leave the indexed text alone, so skip them
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_fts_update
+        AFTER UPDATE OF title, description, solution, customer_id ON ticket BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, solution, customer_id)
+        VALUES ('delete', old.id, old.title, old.description, old.solution, old.customer_id);
+        INSERT INTO {FTS_TABLE}(rowid, title, description, solution, customer_id)
+        VALUES (new.id, new.title, new.description, new.solution, new.customer_id);
+    END""",
+]
+
+
+def install(ticket_table):
+    """Create the index and its triggers whenever `ticket_table` is created."""
+    for statement in CREATE_STATEMENTS:
+        event.listen(ticket_table, 'after_create', DDL(statement))
+
+
+def rebuild(session):
+    """Create the index if missing and re-read every ticket into it."""
+    for statement in CREATE_STATEMENTS:
+        session.execute(text(statement))
+    session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"))
+    session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')"))
+    session.commit()
+
+
+def match_query(search_text):
+    """Turn free text into an FTS5 query in which every word must match.
+
+    Each word is quoted, so characters like - : ( ) in user input are
+    searched for rather than parsed as FTS5 syntax. A trailing * keeps its
+    meaning: `outl*` matches outlook. Only the text columns are searched.
+    """
+    terms = []
+    for word in search_text.split():
+        prefix = word.endswith('*') and len(word) > 1
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return '{title description solution} : (' + ' '.join(terms) + ')' if terms else None
+
+
+def parse_cursor(cursor):
+    # Cursor format: <rank>_<id>
+    try:
+        score, ticket_id = cursor.rsplit('_', 1)
+        return float(score), int(ticket_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search(session, search_text, customer_id=None, cursor=None, page_size=20,
+           window=RANK_WINDOW):
+    """Return (hits, next_cursor); each hit is a Hit(id, score, snippet).
+
+    With `customer_id`, only that customer's tickets are searched.
+    """
+    match = match_query(search_text)
+    if match is None:
+        return [], None
+    scoped = match
+    if customer_id is not None:
+        scoped = f'customer_id : "{int(customer_id)}" AND {match}'
+    params = {'match': scoped, 'limit': page_size + 1, 'window': window}
+    after = ''
+    position = parse_cursor(cursor) if cursor else None
+    if position:
+        after = 'WHERE (score, id) > (:after_score, :after_id)'
+        params['after_score'], params['after_id'] = position
+    rows = session.execute(text(f"""
+        SELECT id, score FROM (
+            SELECT {FTS_TABLE}.rowid AS id, {FTS_TABLE}.rank AS score
+            FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH :match
+            ORDER BY {FTS_TABLE}.rowid DESC
+            LIMIT :window
+        ) {after}
+        ORDER BY score, id
+        LIMIT :limit"""), params).all()
+    next_cursor = f'{rows[page_size - 1].score!r}_{rows[page_size - 1].id}' if len(rows) > page_size else None
+    rows = rows[:page_size]
+    # Snippets only for the page; building them for the whole window costs more than ranking
+    snippets = dict(session.execute(text(f"""
+        SELECT rowid, snippet({FTS_TABLE}, -1, '', '', '…', 16) FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH :match AND rowid IN :ids""").bindparams(bindparam('ids', expanding=True)),
+        {'match': match, 'ids': [row.id for row in rows]}).all()) if rows else {}
+    return [Hit(row.id, row.score, snippets.get(row.id, '')) for row in rows], next_cursor
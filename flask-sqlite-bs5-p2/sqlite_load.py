@@ -0,0 +1,99 @@
+"""Compare SQLite profiles under concurrent readers and writers.
+
+Each worker is a separate process with its own engine, like gunicorn
+workers sharing one database file.
+
+    python sqlite_load.py --writers 4 --readers 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from sqlite_profile import PROFILES, engine_options, install_pragmas
+
+
+def make_engine(profile_name, path):
+    uri = f'sqlite:///{path}'
+    engine = create_engine(uri, **engine_options(profile_name, uri))
+    install_pragmas(engine, PROFILES[profile_name]['pragmas'])
+    return engine
+
+
+def run_worker(kind, profile_name, path, seconds, results):
+    engine = make_engine(profile_name, path)
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                if kind == 'write':
+                    conn.execute(text('INSERT INTO ticket (title, status) VALUES (:t, :s)'),
+                                 {'t': 'load test', 's': 'Open'})
+                else:
+                    conn.execute(text('SELECT id, title FROM ticket WHERE status = :s '
+                                      'ORDER BY id DESC LIMIT 20'), {'s': 'Open'}).fetchall()
+            done += 1
+        except OperationalError:
+            # "database is locked"
+            errors += 1
+    results.put((kind, done, errors))
+    engine.dispose()
+
+
+def run_profile(profile_name, writers, readers, seconds):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        engine = make_engine(profile_name, path)
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE ticket (id INTEGER PRIMARY KEY, title TEXT, status TEXT)'))
+            conn.execute(text('CREATE INDEX ix_ticket_status ON ticket (status)'))
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=(kind, profile_name, path, seconds, results))
+                   for kind in ['write'] * writers + ['read'] * readers]
+        for worker in workers:
+            worker.start()
+        totals = {'write': [0, 0], 'read': [0, 0]}
+        for _ in workers:
+            kind, done, errors = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += errors
+        for worker in workers:
+            worker.join()
+        return {
+            'writes_per_sec': totals['write'][0] / seconds,
+            'reads_per_sec': totals['read'][0] / seconds,
+            'locked_errors': totals['write'][1] + totals['read'][1],
+        }
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['default', 'performance'],
+                        choices=sorted(PROFILES))
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    options = parser.parse_args()
+
+    print(f'{"profile":<12} {"writes/s":>10} {"reads/s":>10} {"locked":>8}')
+    for profile_name in options.profiles:
+        result = run_profile(profile_name, options.writers, options.readers, options.seconds)
+        print(f'{profile_name:<12} {result["writes_per_sec"]:>10.0f} '
+              f'{result["reads_per_sec"]:>10.0f} {result["locked_errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
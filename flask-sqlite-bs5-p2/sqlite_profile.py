@@ -0,0 +1,91 @@
+"""SQLite engine profiles shared by the Flask apps in this repository.
+
+Call configure_sqlite(app) after setting SQLALCHEMY_DATABASE_URI and before
+creating the SQLAlchemy engine, then install_profile_pragmas(app, db) once
+the engine exists. The profile is picked with the SQLITE_PROFILE config key.
+
+Each app runs from its own directory, so this module is copied into every
+app that uses it. Edit the flask-sqlite-bs5-p2 copy and copy it over;
+flask-sqlite-bs5-p2/test_shared_modules.py fails while the copies differ.
+"""
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+PROFILES = {
+    # SQLite's own defaults: rollback journal, synchronous=FULL, no busy wait
+    'default': {
+        'pragmas': {},
+        'pool': {},
+    },
+    # WAL lets readers run alongside a writer; NORMAL only fsyncs at checkpoints
+    'performance': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 268435456,
+            'cache_size': -65536,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'poolclass': QueuePool, 'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+    },
+    # Same concurrency as 'performance' but fsyncs every commit
+    'durable': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'busy_timeout': 5000,
+        },
+        'pool': {'poolclass': QueuePool, 'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+    },
+}
+
+def is_file_database(uri):
+    return uri.startswith('sqlite') and ':memory:' not in uri and not uri.rstrip('/').endswith('sqlite:')
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def engine_options(profile_name, uri):
+    profile = PROFILES[profile_name]
+    if not is_file_database(uri):
+        # In-memory databases are per-connection; a pool would split them.
+        return {}
+    options = dict(profile['pool'])
+    if options:
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+
+def install_pragmas(target, pragmas):
+    """Run `pragmas` on every new DB-API connection made by `target`."""
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, pragmas)
+    event.listen(target, 'connect', set_sqlite_pragmas)
+    return set_sqlite_pragmas
+
+
+def configure_sqlite(app):
+    profile_name = app.config.setdefault('SQLITE_PROFILE', 'performance')
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(profile_name, uri).items():
+        options.setdefault(key, value)
+
+
+def install_profile_pragmas(app, db):
+    """Run the SQLITE_PROFILE pragmas on every new connection of db's engine."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not is_file_database(uri):
+        return None
+    with app.app_context():
+        engine = db.engine
+    return install_pragmas(engine, PROFILES[app.config['SQLITE_PROFILE']]['pragmas'])
@@ -0,0 +1,109 @@
+"""Ticket counts kept in a rollup table so reports never scan the tickets.
+
+ticket_stats holds one row per (dimension, key, status). For example,
+('service_type', 'মেইল', 'Open') is the number of open mail tickets and
+('day', '2024-05-01', 'Resolved') the number of tickets created that day
+which are now resolved. Status totals are the sum over any one dimension.
+
+Like the search index, the table is maintained by triggers on the ticket
+table. Every INSERT, DELETE and UPDATE of a counted column (ORM or bulk)
+moves the ticket between rows in the same transaction, so the counts never
+drift from the tickets. Archiving deletes tickets too, so archived tickets
+leave the counts, which describe active tickets like the dashboards do.
+install() creates it together with the ticket table; for a database that
+already has tickets, or to recompute the counts from scratch, run
+`flask stats-rebuild`.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import DDL, event, text
+
+STATS_TABLE = 'ticket_stats'
+# dimension -> key expression over a ticket row; NULL becomes '' so it can be counted
+DIMENSIONS = {
+    'service_type': "coalesce({row}.service_type, '')",
+    'engineer': "coalesce({row}.engineer_id, '')",
+    'day': "coalesce(date({row}.created_at), '')",
+}
+STATUS = "coalesce({row}.status, '')"
+
+
+def _counts(row, delta):
+    return ',\n'.join(f"('{dimension}', {key.format(row=row)}, {STATUS.format(row=row)}, {delta})"
+                      for dimension, key in DIMENSIONS.items())
+
+
+_UPSERT = f"""INSERT INTO {STATS_TABLE} (dimension, key, status, tickets) VALUES
+        {{rows}}
+        ON CONFLICT (dimension, key, status) DO UPDATE SET tickets = tickets + excluded.tickets;"""
+
+CREATE_STATEMENTS = [
+    f"""CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+        dimension VARCHAR(20) NOT NULL,
+        key VARCHAR(100) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        tickets INTEGER NOT NULL,
+        PRIMARY KEY (dimension, key, status)) WITHOUT ROWID""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_insert AFTER INSERT ON ticket BEGIN
+        {_UPSERT.format(rows=_counts('new', 1))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_delete AFTER DELETE ON ticket BEGIN
+        {_UPSERT.format(rows=_counts('old', -1))}
+    END""",
+    # Title or solution edits leave every count alone, so skip them
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_update
+        AFTER UPDATE OF status, service_type, engineer_id, created_at ON ticket BEGIN
+        {_UPSERT.format(rows=_counts('old', -1) + ',' + _counts('new', 1))}
+    END""",
+]
+
+
+def install(ticket_table):
+    """Create the rollup table and its triggers whenever `ticket_table` is created."""
+    for statement in CREATE_STATEMENTS:
+        event.listen(ticket_table, 'after_create', DDL(statement))
+
+
+def rebuild(session):
+    """Create the rollup table if missing and recount every ticket into it."""
+    for statement in CREATE_STATEMENTS:
+        session.execute(text(statement))
+    session.execute(text(f'DELETE FROM {STATS_TABLE}'))
+    for dimension, key in DIMENSIONS.items():
+        session.execute(text(f"""
+            INSERT INTO {STATS_TABLE} (dimension, key, status, tickets)
+            SELECT '{dimension}', {key.format(row='ticket')}, {STATUS.format(row='ticket')}, count(*)
+            FROM ticket GROUP BY 2, 3"""))
+    session.commit()
+
+
+def status_counts(session):
+    """Return {status: tickets} for all tickets."""
+    rows = session.execute(text(f"""
+        SELECT status, sum(tickets) FROM {STATS_TABLE}
+        WHERE dimension = 'service_type' GROUP BY status HAVING sum(tickets) > 0"""))
+    return dict(rows.all())
+
+
+def summary(session, days=30):
+    """Return {dimension: {key: Counter(status -> tickets)}} plus 'status' totals.
+
+    Only the last `days` days are read for the 'day' dimension, so the cost
+    depends on the number of services, engineers and days shown, never on
+    the number of tickets.
+    """
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    rows = session.execute(text(f"""
+        SELECT dimension, key, status, tickets FROM {STATS_TABLE}
+        WHERE dimension IN ('service_type', 'engineer') AND tickets > 0
+        UNION ALL
+        SELECT dimension, key, status, tickets FROM {STATS_TABLE}
+        WHERE dimension = 'day' AND key >= :since AND tickets > 0"""), {'since': since})
+    result = {dimension: defaultdict(Counter) for dimension in DIMENSIONS}
+    result['status'] = Counter()
+    for dimension, key, status, tickets in rows:
+        result[dimension][key][status] += tickets
+        if dimension == 'service_type':
+            result['status'][status] += tickets
+    return result
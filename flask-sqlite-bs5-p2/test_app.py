@@ -0,0 +1,132 @@
+"""Run with: python -m pytest test_app.py"""
+import os
+import tempfile
+from datetime import timedelta
+
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ['FLASK_CACHE_SHARED_DIR'] = tempfile.mkdtemp()
+os.environ['FLASK_TESTING'] = 'true'  # also makes QueryBudget raise instead of log
+os.environ['FLASK_LOGIN_RATE_LIMITS'] = '{}'
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import app, db, init_db, user_cache, utcnow, Notification, Ticket, User
+from cache import TTLCache
+
+ROLES = ('customer', 'engineer', 'admin')
+
+
+@pytest.fixture(scope='module')
+def ticket_ids():
+    init_db()
+    with app.app_context():
+        password = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+        users = {role: User(email=f'{role}@example.com', password=password, role=role,
+                            name=role.title())
+                 for role in ROLES}
+        db.session.add_all(users.values())
+        db.session.flush()
+        # More tickets than users, so a lazy load per row would exceed the budget
+        tickets = [Ticket(title=f'Ticket {i}', service_type='Email', description='No mail',
+                          status='In Progress', customer_id=users['customer'].id,
+                          engineer_id=users['engineer'].id)
+                   for i in range(5)]
+        db.session.add_all(tickets)
+        db.session.add_all(Notification(content=f'Notification {i}', user_id=users['customer'].id)
+                           for i in range(3))
+        db.session.commit()
+        ids = [ticket.id for ticket in tickets]
+    # Requests get a fresh session; one left open here would answer lazy loads from memory
+    yield ids
+    with app.app_context():
+        db.drop_all()
+
+
+def login(role):
+    client = app.test_client()
+    client.post('/login', data={'email': f'{role}@example.com', 'password': 'secret'})
+    return client
+
+
+@pytest.mark.parametrize('role', ROLES)
+def test_dashboard_renders_within_query_budget(ticket_ids, role):
+    response = login(role).get('/dashboard')
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Ticket 4' in page
+    # The user on a cold cache and the tickets; the admin also reads the status counts
+    assert int(response.headers['X-Query-Count']) <= (3 if role == 'admin' else 2)
+
+
+@pytest.mark.parametrize('role', ROLES)
+def test_view_ticket_renders_within_query_budget(ticket_ids, role):
+    response = login(role).get(f'/ticket/{ticket_ids[0]}')
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Customer' in page and 'Engineer' in page
+    # The budget of 3 leaves room for the archive lookup; an active ticket needs 2
+    assert int(response.headers['X-Query-Count']) <= 2
+
+
+def test_profile_renders_within_query_budget(ticket_ids):
+    response = login('customer').get('/profile')
+
+    assert response.status_code == 200
+    assert 'Notification 2' in response.get_data(as_text=True)
+
+
+def set_role(email, role):
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.email == email).values(role=role))
+        db.session.commit()
+
+
+def test_role_change_reaches_cached_logins(ticket_ids):
+    client = login('engineer')
+    assert client.get('/analytics').status_code == 302
+
+    # As if another worker committed the change: a Core UPDATE fires no ORM events
+    # here, and that worker's cache only reaches this one through the shared file
+    set_role('engineer@example.com', 'admin')
+    TTLCache(shared_file=user_cache.shared_file).delete('2')
+    try:
+        assert client.get('/analytics').status_code == 200
+    finally:
+        set_role('engineer@example.com', 'engineer')
+        user_cache.clear()
+
+
+def test_archived_ticket_is_served_from_archive_and_left_out_of_analytics(ticket_ids):
+    with app.app_context():
+        customer = db.session.scalar(db.select(User).filter_by(email='customer@example.com'))
+        engineer = db.session.scalar(db.select(User).filter_by(email='engineer@example.com'))
+        old = utcnow() - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'] + 1)
+        archived = [Ticket(title=f'Old ticket {i}', service_type='Internet', description='Slow',
+                           status='Confirmed', created_at=old, customer_id=customer.id,
+                           engineer_id=engineer.id)
+                    for i in range(2)]
+        db.session.add_all(archived)
+        # The newest ticket is never archived
+        db.session.add(Ticket(title='Newest', service_type='Email', description='New',
+                              customer_id=customer.id))
+        db.session.commit()
+        archived_ids = [ticket.id for ticket in archived]
+
+    result = app.test_cli_runner().invoke(args=['archive'])
+
+    assert 'Archived 2 tickets' in result.output
+    with app.app_context():
+        assert db.session.get(Ticket, archived_ids[0]) is None
+    response = login('customer').get(f'/ticket/{archived_ids[0]}')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Old ticket 0' in page and 'আর্কাইভ করা' in page
+    response = login('admin').get('/analytics')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'শুধু সক্রিয় টিকেট' in page
+    # Internet only had the archived tickets, so it is gone from the service breakdown
+    assert 'Internet' not in page and 'Email' in page
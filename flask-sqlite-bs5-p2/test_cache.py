@@ -0,0 +1,46 @@
+"""Run with: python -m pytest test_cache.py"""
+import multiprocessing
+
+from cache import TTLCache
+
+
+def delete_in_process(shared_file, key):
+    TTLCache(shared_file=shared_file).delete(key)
+
+
+def test_delete_reaches_other_processes(tmp_path):
+    shared_file = str(tmp_path / 'user.generation')
+    cache = TTLCache(shared_file=shared_file)
+    cache.set('1', {'role': 'admin'})
+    cache.set('2', {'role': 'customer'})
+
+    process = multiprocessing.get_context('fork').Process(target=delete_in_process,
+                                                          args=(shared_file, '1'))
+    process.start()
+    process.join(10)
+
+    assert process.exitcode == 0
+    assert cache.get('1') is None
+    # The whole cache is dropped, then refills as usual
+    assert cache.get('2') is None
+    cache.set('2', {'role': 'customer'})
+    assert cache.get('2') == {'role': 'customer'}
+
+
+def test_clear_reaches_other_caches(tmp_path):
+    shared_file = str(tmp_path / 'user.generation')
+    first, second = TTLCache(shared_file=shared_file), TTLCache(shared_file=shared_file)
+    second.set('1', {'role': 'admin'})
+
+    first.clear()
+
+    assert second.get('1') is None
+
+
+def test_without_shared_file_other_caches_keep_their_entries():
+    first, second = TTLCache(), TTLCache()
+    second.set('1', {'role': 'admin'})
+
+    first.delete('1')
+
+    assert second.get('1') == {'role': 'admin'}
@@ -0,0 +1,47 @@
+"""Run with: python -m pytest test_login_protection.py"""
+import multiprocessing
+import time
+
+from login_protection import PasswordHasher, SharedSlots
+
+PROCESSES = 4
+HASHES = 5
+
+
+def busy(active, peak):
+    with active.get_lock():
+        active.value += 1
+        peak.value = max(peak.value, active.value)
+    time.sleep(0.02)
+    with active.get_lock():
+        active.value -= 1
+
+
+def hash_in_process(directory, slots, active, peak):
+    hasher = PasswordHasher(workers=0, timeout=30, shared=SharedSlots(slots, directory))
+    for _ in range(HASHES):
+        hasher._run(busy, active, peak)
+
+
+def run_processes(directory, slots):
+    context = multiprocessing.get_context('fork')
+    active, peak = context.Value('i', 0), context.Value('i', 0)
+    processes = [context.Process(target=hash_in_process, args=(directory, slots, active, peak))
+                 for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    return peak.value
+
+
+def test_shared_slots_limit_hashing_across_processes(tmp_path):
+    assert run_processes(str(tmp_path), 1) == 1
+    assert run_processes(str(tmp_path), 2) <= 2
+
+
+def test_hashes_with_shared_slots(tmp_path):
+    hasher = PasswordHasher(workers=0, shared=SharedSlots(1, str(tmp_path)), method='pbkdf2:sha256:1000')
+    valid, new_hash = hasher.verify(hasher.generate('secret'), 'secret')
+    assert valid and new_hash is None
@@ -0,0 +1,35 @@
+"""Run with: python -m pytest test_schema.py"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, create_engine, select, tuple_
+from sqlalchemy.orm import Session
+
+import schema
+
+
+def make_table():
+    metadata = MetaData()
+    table = Table('ticket', metadata, Column('id', Integer, primary_key=True),
+                  Column('created_at', DateTime))
+    return metadata, table
+
+
+def test_legacy_timestamps_sort_with_new_ones():
+    metadata, table = make_table()
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Same second: a legacy CURRENT_TIMESTAMP row and rows written by SQLAlchemy
+        connection.exec_driver_sql("INSERT INTO ticket (id, created_at) VALUES (1, '2024-01-01 10:00:00')")
+        connection.execute(table.insert(), [{'id': 2, 'created_at': datetime(2024, 1, 1, 10, 0, 0)},
+                                            {'id': 3, 'created_at': datetime(2024, 1, 1, 9, 0, 0)}])
+
+    with Session(engine) as session:
+        assert schema.upgrade(session, metadata) == ['ticket.created_at format']
+        assert schema.upgrade(session, metadata) == []
+        # The dashboard's keyset query, starting after row 2
+        after = tuple_(table.c.created_at, table.c.id) < (datetime(2024, 1, 1, 10, 0, 0), 2)
+        page = session.scalars(select(table.c.id).where(after)
+                               .order_by(table.c.created_at.desc(), table.c.id.desc())).all()
+
+    assert page == [1, 3]
@@ -0,0 +1,25 @@
+"""Run with: python -m pytest test_shared_modules.py"""
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+
+# Module -> the other apps holding a copy of it; this directory has the original
+COPIES = {
+    'instrumentation.py': ['flask-sqlite-bs5-p1', 'flask-sqlite-bs5-p2 copy',
+                           'flask-rmq-sqlite-bs5', 'flask-rabbitmq-bootstrap/app'],
+    'sqlite_profile.py': ['flask-sqlite-bs5-p1', 'flask-rmq-sqlite-bs5'],
+    'bulk.py': ['flask-sqlite-bs5-p2 copy'],
+}
+
+
+@pytest.mark.parametrize('module, app_dir', [(module, app_dir)
+                                             for module, app_dirs in COPIES.items()
+                                             for app_dir in app_dirs])
+def test_copy_matches_original(module, app_dir):
+    copy = ROOT / app_dir / module
+
+    assert copy.read_bytes() == (HERE / module).read_bytes(), (
+        f'{copy} differs from {HERE / module}; copy the edited module to every app')
@@ -0,0 +1,67 @@
+"""Production entry point for app.py.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+create_app() creates the tables, then warms up what every worker would
+otherwise build on its first requests: compiled templates, the URL map,
+the services cache and SQLAlchemy's compiled statements. gunicorn.conf.py
+preloads this module in the master, so all of that is done once and
+shared by the forked workers. after_fork() then gives each worker its own
+SQLite connections.
+
+Caches, notification streams and the in-process notification writer are
+per worker. Logins and services are still correct across workers: a
+committed change to a user or service empties every worker's cache
+through a file in CACHE_SHARED_DIR, and streams re-check the database
+every NOTIFICATION_STREAM_RECHECK seconds. Workers on other hosts only
+see the change when the entry expires, so they need CACHE_REDIS_URL.
+"""
+import logging
+
+from instrumentation import HISTOGRAMS
+
+import app as ticketing
+
+logger = logging.getLogger(__name__)
+
+
+def warmup(app):
+    """Do the work of a worker's first requests now, in the master."""
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+    with app.app_context():
+        ticketing.get_services()
+        ticketing.stats.status_counts(ticketing.db.session)
+        # The dashboard's ticket query, so its SQL is compiled and cached on the engine
+        query = ticketing.Ticket.query.options(ticketing.joinedload(ticketing.Ticket.customer),
+                                               ticketing.joinedload(ticketing.Ticket.engineer))
+        ticketing.paginate_tickets(query, None, ticketing.DEFAULT_PAGE_SIZE)
+        ticketing.db.session.remove()
+    # One request through the whole stack: URL map, login manager, context processors
+    response = app.test_client().get('/login')
+    if response.status_code != 200:
+        logger.warning('Warmup request to /login returned %s', response.status_code)
+    with app.app_context():
+        # Workers open their own connections; none are left open to inherit
+        ticketing.db.engine.dispose()
+
+
+def after_fork():
+    """Called in each gunicorn worker right after it is forked from the master."""
+    with ticketing.app.app_context():
+        # Forget pooled connections copied from the master without closing
+        # them, so the master's SQLite handles are never used by two processes
+        ticketing.db.engine.dispose(close=False)
+    # Metrics are per worker; don't report the master's warmup as traffic
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+def create_app():
+    ticketing.init_db()
+    warmup(ticketing.app)
+    return ticketing.app
+
+
+app = create_app()